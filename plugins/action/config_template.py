@@ -16,22 +16,36 @@
 # along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
 
 import base64
-import configparser
+import collections
+import collections.abc
+import contextlib
+import contextvars
 import datetime
+import fcntl
+import functools
+import hashlib
+import importlib
 import json
+import marshal
 import os
-import pwd
 import re
+import sys
 import time
+import types
+import uuid
 import yaml
 import tempfile as tmpfilelib
 
-from io import StringIO
+import jinja2
+from jinja2 import meta as jinja2_meta
 
 from ansible.plugins.action import ActionBase
+from ansible.template import Templar
 from ansible.module_utils._text import to_bytes, to_text
 from ansible.module_utils.compat.version import LooseVersion
 from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.utils.hashing import checksum as checksum_file
+from ansible.utils.hashing import checksum_s
 from ansible import constants as C
 from ansible import errors
 try:
@@ -40,461 +54,666 @@ try:
 except ImportError:
     from ansible.parsing.yaml.dumper import AnsibleDumper
 
+try:
+    from ansible._internal._templating._jinja_bits import (
+        AnsibleEnvironment,
+        _TemplateCompileContext
+    )
+except ImportError:
+    _TemplateCompileContext = None
+    try:
+        from ansible.template import AnsibleEnvironment
+    except ImportError:
+        AnsibleEnvironment = None
+
 from ansible import __version__ as __ansible_version__
 
 __metaclass__ = type
 
+# Package of the plugin utils. They are imported the first time they are
+# used, so loading the action plugin does not import the merge library and
+# its dependencies.
+PLUGIN_UTILS = (
+    'ansible_collections.openstack.config_template.plugins.plugin_utils'
+)
+
+
+def _plugin_utils(name):
+    """Return a module of the plugin utils, importing it on first use.
+
+    :param name: ``str``
+    :returns: ``module``
+    """
+    return importlib.import_module('%s.%s' % (PLUGIN_UTILS, name))
+
+
+# Merger of every config_type. A merger is either the name of a method of
+# the action plugin or a "module:callable" reference, imported the first
+# time the config_type is used. Other config types are registered with
+# register_config_type or through a CONFIG_TYPES_ENTRY_POINTS entry point.
 CONFIG_TYPES = {
     'ini': 'return_config_overrides_ini',
     'json': 'return_config_overrides_json',
     'yaml': 'return_config_overrides_yaml'
 }
+CONFIG_TYPES_ENTRY_POINTS = 'openstack.config_template.config_types'
 
-STRIP_MARKER = '__MARKER__'
 
-if yaml.SafeDumper not in AnsibleDumper.__bases__:
-    AnsibleDumper.__bases__ = (yaml.SafeDumper,) + AnsibleDumper.__bases__
+def register_config_type(name, merger):
+    """Register the merger of a config_type.
 
+    The merger is called with the action plugin as its first argument and
+    the ``config_overrides``, ``resultant``, ``list_extend``,
+    ``ignore_none_type``, ``default_section`` and ``yml_multilines`` keyword
+    arguments. It returns the merged text and the merged data, like the
+    ``return_config_overrides_*`` methods of the action plugin.
 
-class IDumper(AnsibleDumper):
-    def increase_indent(self, flow=False, indentless=False):
-        return super(IDumper, self).increase_indent(flow, False)
+    :param name: ``str``
+    :param merger: ``callable`` || ``str``
+    """
+    CONFIG_TYPES[name] = merger
 
 
-class MultiKeyDict(dict):
-    """Dictionary class which supports duplicate keys.
-    This class allows for an item to be added into a standard python dictionary
-    however if a key is created more than once the dictionary will convert the
-    singular value to a python tuple. This tuple type forces all values to be a
-    string.
-    Example Usage:
-    >>> z = MultiKeyDict()
-    >>> z['a'] = 1
-    >>> z['b'] = ['a', 'b', 'c']
-    >>> z['c'] = {'a': 1}
-    >>> print(z)
-    ... {'a': 1, 'b': ['a', 'b', 'c'], 'c': {'a': 1}}
-    >>> z['a'] = 2
-    >>> print(z)
-    ... {'a': tuple(['1', '2']), 'c': {'a': 1}, 'b': ['a', 'b', 'c']}
+@functools.lru_cache(maxsize=None)
+def _config_type_entry_points():
+    try:
+        from importlib import metadata
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            entry_points = entry_points.select(group=CONFIG_TYPES_ENTRY_POINTS)
+        else:
+            entry_points = entry_points.get(CONFIG_TYPES_ENTRY_POINTS, [])
+    except Exception:
+        return {}
+    return {i.name: i.value for i in entry_points}
+
+
+def _config_type_merger(config_type):
+    """Return the merger of a config_type, importing it on first use.
+
+    :param config_type: ``str``
+    :returns: ``callable`` || ``str`` || ``None``
     """
+    merger = CONFIG_TYPES.get(config_type)
+    if merger is None:
+        merger = _config_type_entry_points().get(config_type)
+        if merger is None:
+            return None
+    if isinstance(merger, str) and ':' in merger:
+        module_name, _, attr = merger.partition(':')
+        merger = importlib.import_module(module_name)
+        for name in attr.split('.'):
+            merger = getattr(merger, name)
+    CONFIG_TYPES[config_type] = merger
+    return merger
+
+
+@functools.lru_cache(maxsize=None)
+def _patch_ansible_dumper():
+    """Let the ansible dumper represent the types of the safe dumper.
+
+    This is only done once a yaml file is merged, instead of patching the
+    dumper of every ansible process loading the plugin.
+    """
+    if yaml.SafeDumper not in AnsibleDumper.__bases__:
+        AnsibleDumper.__bases__ = (yaml.SafeDumper,) + AnsibleDumper.__bases__
 
-    def index(self, key):
-        for i, item in enumerate(self):
-            if item.startswith(key):
-                return i
-        raise ValueError(f"{key} not in MultiKeyDict")
-
-    def insert(self, index, key, value):
-        shadow = MultiKeyDict()
-        for i, (k, v) in enumerate(self.items()):
-            shadow[k] = v
-            if i == index:
-                shadow[key] = value
-        else:
-            if index >= len(self) and key not in shadow:
-                shadow[key] = value
-            return shadow
-
-
-    def __setitem__(self, key, value):
-        if key in self:
-            if isinstance(self[key], tuple):
-                items = self[key]
-                if str(value) not in items:
-                    value = items + tuple([str(value)])
-            elif isinstance(self[key], MultiKeyDict):
-                pass
-            else:
-                if str(self[key]) != str(value):
-                    value = tuple([str(self[key]), str(value)])
-
-        super(MultiKeyDict, self).__setitem__(key, value)
-
-
-class ConfigTemplateParser(configparser.RawConfigParser):
-    """configparser which supports multi key value.
-    The parser will use keys with multiple variables in a set as a multiple
-    key value within a configuration file.
-    Default Configuration file:
-    [DEFAULT]
-    things =
-        url1
-        url2
-        url3
-    other = 1,2,3
-    [section1]
-    key = var1
-    key = var2
-    key = var3
-    Example Usage:
-    >>> cp = ConfigTemplateParser(dict_type=MultiKeyDict)
-    >>> cp.read('/tmp/test.ini')
-    ... ['/tmp/test.ini']
-    >>> cp.get('DEFAULT', 'things')
-    ... \nurl1\nurl2\nurl3
-    >>> cp.get('DEFAULT', 'other')
-    ... '1,2,3'
-    >>> cp.set('DEFAULT', 'key1', 'var1')
-    >>> cp.get('DEFAULT', 'key1')
-    ... 'var1'
-    >>> cp.get('section1', 'key')
-    ... {'var1', 'var2', 'var3'}
-    >>> cp.set('section1', 'key', 'var4')
-    >>> cp.get('section1', 'key')
-    ... {'var1', 'var2', 'var3', 'var4'}
-    >>> with open('/tmp/test2.ini', 'w') as f:
-    ...     cp.write(f)
-    Output file:
-    [DEFAULT]
-    things =
-        url1
-        url2
-        url3
-    key1 = var1
-    other = 1,2,3
-    [section1]
-    key = var4
-    key = var1
-    key = var3
-    key = var2
+
+# Compiled template cache, see _compiled_template_cache.
+COMPILED_TEMPLATE_CACHE = collections.OrderedDict()
+COMPILED_TEMPLATE_CACHE_SIZE = 32
+COMPILED_TEMPLATE_CACHE_DIR = 'config_template-bytecode'
+
+
+def _compile_setting(value):
+    """Return a representation of a compile setting stable across processes.
+
+    :param value: ``object``
+    :returns: ``object``
     """
+    if callable(value):
+        return '%s.%s' % (
+            getattr(value, '__module__', None),
+            getattr(value, '__qualname__', type(value).__name__)
+        )
+    return value
 
-    def __init__(self, *args, **kwargs):
-        self.ignore_none_type = bool(kwargs.pop('ignore_none_type', True))
-        self.default_section = str(kwargs.pop('default_section', 'DEFAULT'))
-        self.yml_multilines = bool(kwargs.pop('yml_multilines', False))
-        self._comment_prefixes = kwargs.pop('comment_prefixes', '/')
-        self._empty_lines_in_values = kwargs.get('allow_no_value', True)
-        self._strict = kwargs.get('strict', False)
-        self._allow_no_value = self._empty_lines_in_values
-        configparser.RawConfigParser.__init__(self, *args, **kwargs)
-
-    def set(self, section, option, value=None):
-        if not section or section == 'DEFAULT':
-            sectdict = self._defaults
-            use_defaults = True
-        else:
-            try:
-                sectdict = self._sections[section]
-            except KeyError:
-                raise SystemError('Section %s not found' % section)
-            else:
-                use_defaults = False
 
-        option = self.optionxform(option)
-        if use_defaults:
-            try:
-                index = sectdict.index('#%s' % option)
-            except (ValueError, IndexError):
-                sectdict[option] = value
-            else:
-                self._defaults = sectdict.insert(index, option, value)
-        else:
-            sectdict[option] = value
-
-    def _write(self, fp, section, key, item, entry):
-        if section:
-            # If we are not ignoring a none type value, then print out
-            # the option name only if the value type is None.
-            if not self.ignore_none_type and item is None:
-                fp.write(key + '\n')
-                return
-
-        fp.write(entry)
-
-    def _write_check(self, fp, key, value, section=False):
-        def _return_entry(option, item):
-            # If we have item, we consider it as a config parameter with value
-            if item is not None:
-                str_item = str(item).replace('\n', '\n\t')
-                return f"{option} = {str_item}\n"
-            elif not option:
-                return option
-            else:
-                return f"{option}\n"
-
-        key = key.split(STRIP_MARKER)[0]
-        if isinstance(value, (tuple, set)):
-            for i in sorted(value):
-                entry = _return_entry(option=key, item=i)
-                self._write(fp, section, key, i, entry)
-        elif isinstance(value, list):
-            _value = [str(i).replace('\n', '\n\t') for i in value]
-            entry = f"{key} = {','.join(_value)}\n"
-            self._write(fp, section, key, value, entry)
-        else:
-            entry = _return_entry(option=key, item=value)
-            self._write(fp, section, key, value, entry)
-
-    def write(self, fp, **kwargs):
-        def _do_write(section_name, section, section_bool=False):
-            fp.write(f"[{section_name}]\n")
-            for key, value in section.items():
-                self._write_check(
-                    fp,
-                    key=key,
-                    value=value,
-                    section=section_bool
-                )
+def _compiled_template_key(environment, source):
+    """Return the cache key of a template compiled by an environment.
+
+    The delimiters are read from the environment doing the compilation, so
+    the key covers both the task level overrides and the ones set from the
+    ``#jinja2:`` header of the template. ansible-core 2.19 escapes the
+    backslashes of a template while lexing it, depending on the compile
+    context, so it is part of the key as well.
+    """
+    compile_context = None
+    if _TemplateCompileContext is not None:
+        compile_context = _TemplateCompileContext.current(optional=True)
+    settings = repr((
+        type(environment).__module__,
+        type(environment).__name__,
+        environment.block_start_string,
+        environment.block_end_string,
+        environment.variable_start_string,
+        environment.variable_end_string,
+        environment.comment_start_string,
+        environment.comment_end_string,
+        environment.line_statement_prefix,
+        environment.line_comment_prefix,
+        environment.trim_blocks,
+        environment.lstrip_blocks,
+        environment.newline_sequence,
+        environment.keep_trailing_newline,
+        environment.optimized,
+        _compile_setting(environment.finalize),
+        _compile_setting(environment.autoescape),
+        sorted(environment.extensions),
+        getattr(compile_context, 'escape_backslashes', None),
+    ))
+    key = hashlib.sha256(to_bytes(settings))
+    key.update(to_bytes(source, errors='surrogate_or_strict'))
+    return key.hexdigest()
+
+
+def _load_compiled_template(key):
+    cached = COMPILED_TEMPLATE_CACHE.get(key)
+    if cached is not None:
+        COMPILED_TEMPLATE_CACHE.move_to_end(key)
+        return cached
+
+    path = os.path.join(C.DEFAULT_LOCAL_TMP, COMPILED_TEMPLATE_CACHE_DIR, key)
+    try:
+        with open(path, 'rb') as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _store_compiled_template(key, code):
+    COMPILED_TEMPLATE_CACHE[key] = code
+    if len(COMPILED_TEMPLATE_CACHE) > COMPILED_TEMPLATE_CACHE_SIZE:
+        COMPILED_TEMPLATE_CACHE.popitem(last=False)
+
+    cache_dir = os.path.join(C.DEFAULT_LOCAL_TMP, COMPILED_TEMPLATE_CACHE_DIR)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tmpfilelib.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump(code, f)
+        os.replace(tmp_path, os.path.join(cache_dir, key))
+    except (OSError, ValueError):
+        pass
+
+
+# Set by _compiled_template_cache while the next compilation is cached.
+COMPILED_TEMPLATE_PENDING = contextvars.ContextVar(
+    'config_template_compile', default=False
+)
+
+
+def _install_compiled_template_cache(environment_class):
+    """Route the compilations of an environment class through the cache.
+
+    The class is wrapped once, when the plugin is loaded. The wrapper only
+    uses the cache within _compiled_template_cache, in the context it was
+    entered in, and compiles like jinja does everywhere else.
+
+    :param environment_class: ``type``
+    """
+    original_compile = environment_class.compile
 
-            fp.write("\n")
+    def compile(environment, source, name=None, filename=None, raw=False,
+                defer_init=False):
+        if not COMPILED_TEMPLATE_PENDING.get():
+            return original_compile(
+                environment, source, name, filename, raw, defer_init
+            )
+        COMPILED_TEMPLATE_PENDING.set(False)
+        if (not isinstance(source, str) or name or filename or raw or
+                defer_init or
+                getattr(environment, '_debuggable_template_source', False)):
+            return original_compile(
+                environment, source, name, filename, raw, defer_init
+            )
 
-        if self.default_section != 'DEFAULT':
-            if not self._sections.get(self.default_section, False):
-                _do_write(
-                    section_name=self.default_section,
-                    section=self._sections[self.default_section],
-                    section_bool=True
-                )
-        elif self._defaults:
-            _do_write('DEFAULT', self._defaults)
-
-        for i in self._sections:
-            _do_write(i, self._sections[i], section_bool=True)
-
-    def _read(self, fp, fpname):
-        optname = None
-        cursect = {}
-        marker_counter = 0
-        for lineno, line in enumerate(fp, start=0):
-            marker_counter += 1
-            mo_match = self.SECTCRE.match(line)
-            mo_optcre = self._optcre.match(line)
-            if mo_match:
-                sectname = mo_match.group('header')
-                if sectname in self._sections:
-                    cursect = self._sections[sectname]
-                elif sectname == 'DEFAULT':
-                    cursect = self._defaults
-                else:
-                    cursect = self._dict()
-                    self._sections[sectname] = cursect
-            elif mo_optcre:
-                optname, vi, optval = mo_optcre.group('option', 'vi', 'value')
-                optname = self.optionxform(optname.rstrip())
-                if optname and not optname.startswith('#') and optval:
-                    if vi in ('=', ':') and ';' in optval:
-                        pos = optval.find(';')
-                        if pos != -1 and optval[pos - 1].isspace():
-                            optval = optval[:pos]
-                    optval = optval.strip()
-                    if optval == '""':
-                        optval = ''
-                else:
-                    optname = '%s%s-%d' % (
-                        optname,
-                        STRIP_MARKER,
-                        marker_counter
-                    )
-                cursect[optname] = optval
-            else:
-                optname = '%s-%d' % (
-                    STRIP_MARKER,
-                    marker_counter
-                )
-                cursect[optname] = None
+        key = _compiled_template_key(environment, source)
+        code = _load_compiled_template(key)
+        if code is None:
+            code = original_compile(environment, source)
+            _store_compiled_template(key, code)
+        return code
+
+    environment_class.compile = compile
+
+
+if AnsibleEnvironment is not None:
+    _install_compiled_template_cache(AnsibleEnvironment)
+
+
+@contextlib.contextmanager
+def _compiled_template_cache():
+    """Serve the next template compilation from the compiled template cache.
+
+    Jinja compiles a template into a code object which does not depend on
+    the environment instance, only on its settings. The first compilation
+    done inside the context, which is the top level template handed to the
+    templar, is looked up in a bounded LRU cache of the worker process and
+    then in the local temporary directory of the running ansible process,
+    shared by all of the forks. Any other compilation, like the ones of
+    nested variables, is left untouched.
+    """
+    token = COMPILED_TEMPLATE_PENDING.set(True)
+    try:
+        yield
+    finally:
+        COMPILED_TEMPLATE_PENDING.reset(token)
+
+
+# Capabilities of the running ansible, resolved once when the plugin is
+# loaded instead of on every templated file.
+ANSIBLE_VERSION = LooseVersion(__ansible_version__)
+TRUSTED_TEMPLATES = ANSIBLE_VERSION >= LooseVersion('2.19')
+TEMPLATE_KWARGS = dict(
+    preserve_trailing_newlines=True,
+    escape_backslashes=False
+)
+if ANSIBLE_VERSION < LooseVersion('2.17'):
+    TEMPLATE_KWARGS['convert_data'] = False
+
+
+def _render_with_new_env(templar, data, searchpath, overrides):
+    templar = templar.copy_with_new_env(searchpath=searchpath)
+    with _compiled_template_cache():
+        return templar.template(data, overrides=overrides, **TEMPLATE_KWARGS)
+
+
+def _render_with_temporary_context(templar, data, searchpath, overrides):
+    with templar.set_temporary_context(searchpath=searchpath):
+        with _compiled_template_cache():
+            return templar.template(
+                data, overrides=overrides, **TEMPLATE_KWARGS
+            )
+
+
+def _render_trusted(templar, data, searchpath, overrides):
+    return _render_with_new_env(
+        templar, trust_as_template(data), searchpath, overrides
+    )
+
+
+if TRUSTED_TEMPLATES:
+    _render_template = _render_trusted
+elif hasattr(Templar, 'copy_with_new_env'):
+    _render_template = _render_with_new_env
+else:
+    _render_template = _render_with_temporary_context
+
+
+RENDER_CACHE_DIR = 'config_template-render'
+
+
+@functools.lru_cache(maxsize=None)
+def _merger_digest(*paths):
+    """Return a digest of the merge code, part of the persistent cache keys.
 
+    Entries written by another version of the plugin and of the merge
+    library, or of the module of a registered merger, are never reused.
 
-class DictCompare(object):
+    :param paths: ``str``
+    :returns: ``str``
     """
-    Calculate the difference between two dictionaries.
+    digest = hashlib.sha256()
+    for path in paths or (__file__, _plugin_utils('config_merge').__file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Template globals which make the rendered result depend on more than the
+# referenced variables, see ActionModule._render_fingerprint.
+UNCACHEABLE_TEMPLATE_NAMES = frozenset(
+    ['hostvars', 'vars', 'lookup', 'query', 'q', 'now']
+)
+
+# Template globals ansible adds to the ones of jinja, which are not
+# variables of the task, see ActionModule._referenced_variables.
+ANSIBLE_TEMPLATE_GLOBALS = frozenset(['omit', 'undef'])
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_environment(**delimiters):
+    """Return a jinja environment parsing templates like the templar does.
+
+    Templates are only parsed, never rendered, by this environment, so it is
+    built apart from the templar and does not need its filters or tests.
+
+    :param delimiters: ``str`` delimiters of the task
+    :returns: ``jinja2.Environment``
+    """
+    return jinja2.Environment(
+        extensions=list(C.DEFAULT_JINJA2_EXTENSIONS or []),
+        **delimiters
+    )
+
+
+def _encode_cached(value):
+    """Return a JSON serializable copy of a merged config.
+
+    Tuples and sets are tagged so they can be restored by _decode_cached,
+    as the diff of MultiStrOpts relies on them. Types which JSON does not
+    support raise TypeError.
+    """
+    if isinstance(value, dict):
+        return {'__dict__': [
+            [_encode_cached(k), _encode_cached(v)] for k, v in value.items()
+        ]}
+    elif isinstance(value, tuple):
+        return {'__tuple__': [_encode_cached(i) for i in value]}
+    elif isinstance(value, (set, frozenset)):
+        return {'__set__': [_encode_cached(i) for i in value]}
+    elif isinstance(value, list):
+        return [_encode_cached(i) for i in value]
+    elif value is None or isinstance(value, (bool, int, float)):
+        return value
+    elif isinstance(value, str):
+        return str(value)
+    raise TypeError('%s can not be cached' % type(value))
+
+
+def _decode_cached(value):
+    if isinstance(value, dict):
+        if '__tuple__' in value:
+            return tuple(_decode_cached(i) for i in value['__tuple__'])
+        elif '__set__' in value:
+            return set(_decode_cached(i) for i in value['__set__'])
+        return dict(
+            (_decode_cached(k), _decode_cached(v))
+            for k, v in value['__dict__']
+        )
+    elif isinstance(value, list):
+        return [_decode_cached(i) for i in value]
+    return value
+
+
+# Default maximum size of the merge cache, in megabytes.
+CACHE_SIZE = 256
+
+
+class ResultCache(object):
+    """Controller side store of merged results.
+
+    Every entry is a JSON file named after its key and holding the resultant
+    file and the merged config used to build diffs. Entries are written
+    atomically, so the cache can be shared by all of the forks and by
+    successive runs. When a maximum size, in bytes, is given the least
+    recently used entries are evicted once the cache grows past it.
+
+    The size of the cache is not measured on every write. The size found by
+    the last eviction is recorded in the cache and every process adds the
+    entries it writes to it, under a lock, the directory is only scanned once
+    this estimate crosses the maximum size. Evictions go down to a fraction
+    of the maximum size, so they only happen every so many writes.
 
     Example Usage:
-    >>> base_dict = {'test1': 'val1', 'test2': 'val2', 'test3': 'val3'}
-    >>> new_dict = {'test1': 'val2', 'test3': 'val3', 'test4': 'val3'}
-    >>> dc = DictCompare(base_dict, new_dict)
-    >>> dc.added()
-    ... ['test4']
-    >>> dc.removed()
-    ... ['test2']
-    >>> dc.changed()
-    ... ['test1']
-    >>> dc.get_changes()
-    ... {'added':
-    ...     {'test4': 'val3'},
-    ...  'removed':
-    ...     {'test2': 'val2'},
-    ...  'changed':
-    ...     {'test1': {'current_val': 'vol1', 'new_val': 'val2'}
-    ... }
+    >>> cache = ResultCache('/tmp/cache')
+    >>> cache.set('abc', 'key = value\n', {'DEFAULT': {'key': 'value'}})
+    >>> cache.get('abc')
+    ... ('key = value\n', {'DEFAULT': {'key': 'value'}})
     """
 
-    def __init__(self, base_dict, new_dict):
-        self.new_dict, self.base_dict = new_dict, base_dict
-        self.base_items, self.new_items = set(
-            self.base_dict.keys()), set(self.new_dict.keys())
-        self.intersect = self.new_items.intersection(self.base_items)
+    USAGE_FILE = '.usage'
+    EVICT_TARGET = 0.9
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
 
-    def added(self):
-        return self.new_items - self.intersect
+    def _add_usage(self, size):
+        """Add the size of a new entry to the recorded size of the cache.
 
-    def removed(self):
-        return self.base_items - self.intersect
+        The usage file is locked while it is updated, so the entries written
+        by every process sharing the cache are accounted for. The cache is
+        evicted, with the lock held, when the size is unknown or crosses the
+        maximum size.
 
-    def changed(self):
-        return set(
-            x for x in self.intersect if self.base_dict[x] != self.new_dict[x])
+        :param size: ``int``
+        """
+        try:
+            fd = os.open(
+                self._entry_path(self.USAGE_FILE), os.O_RDWR | os.O_CREAT,
+                0o600
+            )
+        except OSError:
+            return
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                usage = int(f.read())
+            except ValueError:
+                usage = None
+            if usage is None or usage + size > self.max_size:
+                usage = self.evict()
+            else:
+                usage += size
+            f.seek(0)
+            f.truncate()
+            f.write(str(usage))
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.max_size:
+            # The modification time tracks the last use of an entry.
+            try:
+                os.utime(entry_path)
+            except OSError:
+                pass
+        return entry['resultant'], _decode_cached(entry['config_base'])
 
-    def get_changes(self):
-        """Returns dict of differences between 2 dicts and bool indicating if
-        there are differences
+    def evict(self):
+        """Remove the least recently used entries above the target size.
 
-        :param base_dict: ``dict``
-        :param new_dict: ``dict``
-        :returns: ``dict``, ``bool``
+        Callers hold the lock of the usage file, see _add_usage.
+
+        :returns: ``int`` size of the cache left
         """
-        changed = False
-        mods = {'added': {}, 'removed': {}, 'changed': {}}
-
-        for s in self.changed():
-            changed = True
-            if type(self.base_dict[s]) is not dict:
-                mods['changed'] = {
-                    s: {'current_val': self.base_dict[s],
-                        'new_val': self.new_dict[s]}}
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.name == self.USAGE_FILE:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return 0
+
+        target = self.max_size * self.EVICT_TARGET
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
                 continue
+            total -= size
+        return total
 
-            diff = DictCompare(self.base_dict[s], self.new_dict[s])
-            for a in diff.added():
-                if s not in mods['added']:
-                    mods['added'][s] = {a: self.new_dict[s][a]}
-                else:
-                    mods['added'][s][a] = self.new_dict[s][a]
+    def set(self, key, resultant, config_base):
+        try:
+            entry = json.dumps(
+                dict(
+                    resultant=resultant,
+                    config_base=_encode_cached(config_base)
+                )
+            )
+        except TypeError:
+            return False
 
-            for r in diff.removed():
-                if s not in mods['removed']:
-                    mods['removed'][s] = {r: self.base_dict[s][r]}
-                else:
-                    mods['removed'][s][r] = self.base_dict[s][r]
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp_path = tmpfilelib.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'w') as f:
+                f.write(entry)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            return False
+
+        if self.max_size:
+            self._add_usage(len(entry))
+        return True
+
+
+# Environment variables enabling cProfile and tracemalloc for every task,
+# see ActionModule._profiled_run.
+PROFILE_DIR_ENV = 'CONFIG_TEMPLATE_PROFILE_DIR'
+PROFILE_MEMORY_ENV = 'CONFIG_TEMPLATE_PROFILE_MEMORY'
+PROFILE_MEMORY_FRAMES = 10
+PROFILE_TOP = 25
+
+# Options of a task rendering several files, see ActionModule._run_batch.
+# The task options are shared by every file, the unsupported ones keep
+# state between the files of a task.
+BATCH_WORKERS = 4
+BATCH_TASK_OPTIONS = ('files', 'batch_workers', 'cache_dir', 'cache_size',
+                      'reuse_tmp', 'cleanup_tmp', 'profile_dir',
+                      'profile_memory')
+# Errors ending a batch task, like they end a task templating a single
+# file, instead of failing one of its files.
+BATCH_FATAL_ERRORS = (errors.AnsibleConnectionFailure,
+                      errors.AnsibleActionFail)
+# Options of a file read by ActionModule._merge, resolved for every file of
+# a batch before it is handed to the pool.
+MERGE_OPTIONS = ('config_type', 'config_overrides', 'list_extend',
+                 'ignore_none_type', 'default_section', 'yml_multilines',
+                 'share_parsed_base', 'cache_dir', 'cache_size')
+BATCH_UNSUPPORTED_OPTIONS = ('profile', 'render_dedup', 'run_journal',
+                             'share_parsed_base', 'stream')
+
+# Options which need the whole file, they can not be used with stream.
+STREAM_UNSUPPORTED_OPTIONS = ('remote_src', 'render_dedup', 'run_journal',
+                              'share_parsed_base')
+
+
+class PhaseTimer(object):
+    """Monotonic timings and byte counts of the phases of a task.
+
+    Every call to lap records the time elapsed since the previous one under
+    the name of the phase which just ended. A disabled timer records
+    nothing.
 
-            for c in diff.changed():
-                if s not in mods['changed']:
-                    mods['changed'][s] = {
-                        c: {'current_val': self.base_dict[s][c],
-                            'new_val': self.new_dict[s][c]}}
-                else:
-                    mods['changed'][s][c] = {
-                        'current_val': self.base_dict[s][c],
-                        'new_val': self.new_dict[s][c]}
+    Example Usage:
+    >>> timer = PhaseTimer(True)
+    >>> resultant = render()
+    >>> timer.lap('render')
+    >>> timer.count('rendered', resultant)
+    >>> timer.result(dest='/etc/nova/nova.conf')
+    ... {'dest': '/etc/nova/nova.conf', 'phases': {'render': 0.0042},
+    ...  'bytes': {'rendered': 1024}, 'total': 0.0042}
+    """
 
-        for s in self.added():
-            changed = True
-            mods['added'][s] = self.new_dict[s]
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.phases = collections.OrderedDict()
+        self.bytes = collections.OrderedDict()
+        self.started = self.last = time.monotonic() if enabled else None
+
+    def lap(self, phase):
+        if self.enabled:
+            now = time.monotonic()
+            self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+            self.last = now
+
+    def count(self, name, value):
+        if self.enabled and value is not None:
+            if isinstance(value, str):
+                value = len(to_bytes(value))
+            elif not isinstance(value, int):
+                value = os.fstat(value.fileno()).st_size
+            self.bytes[name] = value
+
+    def result(self, **identity):
+        identity.update(
+            phases={k: round(v, 6) for k, v in self.phases.items()},
+            bytes=dict(self.bytes),
+            total=round(time.monotonic() - self.started, 6)
+        )
+        return identity
+
+
+def _fingerprint_value(value):
+    """Return a JSON serializable and stable representation of a value."""
+    if isinstance(value, collections.abc.Mapping):
+        return sorted(
+            [str(k), _fingerprint_value(v)] for k, v in value.items()
+        )
+    elif isinstance(value, (list, tuple)):
+        return [_fingerprint_value(i) for i in value]
+    elif isinstance(value, (set, frozenset)):
+        return sorted(_fingerprint_value(i) for i in value)
+    elif value is None or isinstance(value, (bool, int, float)):
+        return value
+    elif isinstance(value, str):
+        return str(value)
+    return repr(value)
 
-        for s in self.removed():
-            changed = True
-            mods['removed'][s] = self.base_dict[s]
 
-        return mods, changed
+class IDumper(AnsibleDumper):
+    def increase_indent(self, flow=False, indentless=False):
+        return super(IDumper, self).increase_indent(flow, False)
 
 
 class ActionModule(ActionBase):
     TRANSFERS_FILES = True
 
+    # Replaced by run, tasks are only timed with the profile option.
+    _timer = PhaseTimer(False)
+
     def return_config_overrides_ini(self,
                                     config_overrides,
                                     resultant,
                                     list_extend=True,
                                     ignore_none_type=True,
                                     default_section='DEFAULT',
-                                    yml_multilines=False):
+                                    yml_multilines=False,
+                                    share_parsed_base=False):
         """Returns string value from a modified config file and dict of
         merged config
 
         :param config_overrides: ``dict``
-        :param resultant: ``str`` || ``unicode``
+        :param resultant: ``str`` || ``unicode`` || ``file``
+        :param share_parsed_base: ``bool``
         :returns: ``str``, ``dict``
         """
-        def _add_section(section_name):
-            # Attempt to add a section to the config file passing if
-            #  an error is raised that is related to the section
-            #  already existing.
-            try:
-                config.add_section(section_name)
-            except (configparser.DuplicateSectionError, ValueError):
-                pass
-
-        config = ConfigTemplateParser(
-            allow_no_value=True,
-            dict_type=MultiKeyDict,
-            ignore_none_type=ignore_none_type,
-            default_section=default_section,
-            yml_multilines=yml_multilines,
-            comment_prefixes='/'
-        )
-        config.optionxform = str
-
-        config_object = StringIO(resultant)
-        config.read_file(config_object)
-
-        if default_section != 'DEFAULT':
-            _add_section(section_name=default_section)
-
-        for section, items in config_overrides.items():
-            # If the items value is not a dictionary it is assumed that the
-            #  value is a default item for this config type.
-            if not isinstance(items, dict):
-                if isinstance(items, list):
-                    items = ','.join(to_text(i) for i in items)
-
-                self._option_write(
-                    config,
-                    default_section,
-                    section,
-                    items
-                )
-            else:
-                _add_section(section_name=section)
-                for key, value in items.items():
-                    try:
-                        self._option_write(config, section, key, value)
-                    except configparser.NoSectionError as exp:
-                        error_msg = str(exp)
-                        error_msg += (
-                            ' Try being more explicit with your override'
-                            'data. Sections are case sensitive.'
-                        )
-                        raise errors.AnsibleModuleError(error_msg)
-
-        config_object.close()
-
-        config_dict_new = dict()
-        config_defaults = config.defaults()
-        for s in config.sections():
-            config_dict_new[s] = dict()
-            for k, v in config.items(s):
-                if k not in config_defaults or config_defaults[k] != v:
-                    config_dict_new[s][k] = v
-                else:
-                    if default_section in config_dict_new:
-                        config_dict_new[default_section][k] = v
-                    else:
-                        config_dict_new[default_section] = {k: v}
-
-        resultant_stringio = StringIO()
+        config_merge = _plugin_utils('config_merge')
         try:
-            config.write(resultant_stringio)
-            return resultant_stringio.getvalue(), config_dict_new
-        finally:
-            resultant_stringio.close()
-
-    @staticmethod
-    def _option_write(config, section, key, value):
-        s_section = str(section)
-        s_key = str(key)
-        config.remove_option(s_section, s_key)
-        if isinstance(value, dict):
-            # If a dict is passed, check if it's effectively empty (no true values)
-            if not any(value.values()):
-                value = tuple(value.keys())
-
-        if isinstance(value, (tuple, set)):
-            config.set(s_section, s_key, value)
-        elif isinstance(value, list):
-            config.set(s_section, s_key, ','.join(map(str, value)))
-        else:
-            config.set(s_section, s_key, str(value))
+            return config_merge.merge_ini(
+                config_overrides=config_overrides,
+                resultant=resultant,
+                list_extend=list_extend,
+                ignore_none_type=ignore_none_type,
+                default_section=default_section,
+                yml_multilines=yml_multilines,
+                share_parsed_base=share_parsed_base
+            )
+        except config_merge.ConfigTemplateError as exp:
+            raise errors.AnsibleModuleError(to_text(exp))
 
     def return_config_overrides_json(self,
                                      config_overrides,
@@ -509,21 +728,15 @@ class ActionModule(ActionBase):
         information within the json file will be sorted by keys.
 
         :param config_overrides: ``dict``
-        :param resultant: ``str`` || ``unicode``
+        :param resultant: ``str`` || ``unicode`` || ``file``
         :returns: ``str``, ``dict``
         """
-        original_resultant = json.loads(resultant)
-        merged_resultant = self._merge_dict(
-            base_items=original_resultant,
-            new_items=config_overrides,
+        return _plugin_utils('config_merge').merge_json(
+            config_overrides=config_overrides,
+            resultant=resultant,
             list_extend=list_extend,
             yml_multilines=yml_multilines
         )
-        return json.dumps(
-            merged_resultant,
-            indent=4,
-            sort_keys=True
-        ), merged_resultant
 
     def return_config_overrides_yaml(self,
                                      config_overrides,
@@ -534,23 +747,21 @@ class ActionModule(ActionBase):
                                      yml_multilines=False):
         """Return config yaml and dict of merged config
 
+        The ansible dumper is used, so values coming from ansible variables
+        are represented like any other string.
+
         :param config_overrides: ``dict``
-        :param resultant: ``str`` || ``unicode``
+        :param resultant: ``str`` || ``unicode`` || ``file``
         :returns: ``str``, ``dict``
         """
-        original_resultant = yaml.safe_load(resultant)
-        merged_resultant = self._merge_dict(
-            base_items=original_resultant,
-            new_items=config_overrides,
+        _patch_ansible_dumper()
+        return _plugin_utils('config_merge').merge_yaml(
+            config_overrides=config_overrides,
+            resultant=resultant,
             list_extend=list_extend,
-            yml_multilines=yml_multilines
+            yml_multilines=yml_multilines,
+            dumper=IDumper
         )
-        return yaml.dump(
-            merged_resultant,
-            Dumper=IDumper,
-            default_flow_style=False,
-            width=1000,
-        ), merged_resultant
 
     def _merge_dict(self,
                     base_items,
@@ -563,52 +774,31 @@ class ActionModule(ActionBase):
         :param new_items: ``dict`` || ``list``
         :returns: ``dict``
         """
-        if isinstance(new_items, dict):
-            for key, value in new_items.items():
-                if isinstance(value, dict):
-                    base_items[key] = self._merge_dict(
-                        base_items=base_items.get(key, {}),
-                        new_items=value,
-                        list_extend=list_extend
-                    )
-                elif (not isinstance(value, int) and (
-                      ',' in value or (
-                        '\n' in value and not yml_multilines))):
-                    base_items[key] = re.split(',|\n', value)
-                    base_items[key] = [
-                        i.strip() for i in base_items[key] if i
-                    ]
-                elif isinstance(value, list):
-                    if isinstance(base_items.get(key), list) and list_extend:
-                        base_items[key].extend(value)
-                    else:
-                        base_items[key] = value
-                elif isinstance(value, (tuple, set)):
-                    le = list_extend  # assigned for pep8
-                    if isinstance(base_items.get(key), tuple) and le:
-                        base_items[key] += tuple(value)
-                    elif isinstance(base_items.get(key), list) and le:
-                        base_items[key].extend(list(value))
-                    else:
-                        base_items[key] = value
-                else:
-                    base_items[key] = new_items[key]
-        elif isinstance(new_items, list):
-            if list_extend:
-                base_items.extend(new_items)
-            else:
-                base_items = new_items
-        return base_items
+        return _plugin_utils('config_merge').merge_dict(
+            base_items=base_items,
+            new_items=new_items,
+            list_extend=list_extend,
+            yml_multilines=yml_multilines
+        )
 
     def _load_options_and_status(self, task_vars):
         """Return options and status from module load."""
 
         config_type = self._task.args.get('config_type')
-        if config_type not in ['ini', 'yaml', 'json']:
+        try:
+            merger = _config_type_merger(config_type)
+        except (ImportError, AttributeError) as exp:
+            return False, dict(
+                failed=True,
+                msg="Can not load the merger of [ config_type ] %s: %s" % (
+                    config_type, to_text(exp)
+                )
+            )
+        if merger is None:
             return False, dict(
                 failed=True,
                 msg="No valid [ config_type ] was provided. Valid options are"
-                    " ini, yaml, or json."
+                    " %s." % ', '.join(sorted(CONFIG_TYPES))
             )
 
         # Access to protected method is unavoidable in Ansible
@@ -627,13 +817,9 @@ class ActionModule(ActionBase):
             strict=False
         )
         if remote_src:
-            slurpee = self._execute_module(
-                module_name='slurp',
-                module_args=dict(src=user_source),
-                task_vars=task_vars
-            )
-            _content = base64.b64decode(slurpee['content'])
-            _user_content = _content.decode('utf-8')
+            # The remote source is only read once the template variables are
+            # prepared, see _read_remote_source.
+            _user_content = None
         else:
             # (alextricity25) It's possible that the user could pass in a
             # datatype and not always a string. In this case we don't want
@@ -647,7 +833,7 @@ class ActionModule(ActionBase):
                 if self._task.args.get('config_type') == 'json':
                     _user_content = json.dumps(_user_content)
 
-        user_content = str(_user_content)
+        user_content = str(_user_content) if _user_content is not None else ''
         if not user_source:
             if not user_content:
                 return False, dict(
@@ -655,22 +841,18 @@ class ActionModule(ActionBase):
                     msg="No user [ src ] or [ content ] was provided"
                 )
             else:
-                tmp_content = None
-                fd, tmp_content = tmpfilelib.mkstemp()
-                try:
-                    with open(tmp_content, 'wb') as f:
-                        f.write(user_content.encode())
-                except Exception as err:
-                    os.remove(tmp_content)
-                    raise Exception(err)
-                self._task.args['src'] = source = tmp_content
+                # The content is kept in memory for the whole run, there is
+                # no template file on the controller.
+                source = None
+                content = user_content
         else:
             source = self._loader.path_dwim_relative(
                 file_path,
                 'templates',
                 user_source
             )
-        searchpath.insert(1, os.path.dirname(source))
+            content = None
+            searchpath.insert(1, os.path.dirname(source))
 
         _dest = self._task.args.get('dest')
         list_extend = self._task.args.get('list_extend')
@@ -683,6 +865,12 @@ class ActionModule(ActionBase):
             # Expand any user home dir specification
             user_dest = self._remote_expand_user(_dest)
             if user_dest.endswith(os.sep):
+                if not source:
+                    return False, dict(
+                        failed=True,
+                        msg="Can not use [ content ] with a directory as"
+                            " [ dest ]"
+                    )
                 user_dest = os.path.join(user_dest, os.path.basename(source))
 
         # Get ignore_none_type
@@ -697,6 +885,57 @@ class ActionModule(ActionBase):
         default_section = self._task.args.get('default_section', 'DEFAULT')
         remote_src = self._task.args.get('remote_src', False)
 
+        share_parsed_base = boolean(
+            self._task.args.get('share_parsed_base', False),
+            strict=False
+        )
+        if share_parsed_base and config_type != 'ini':
+            return False, dict(
+                failed=True,
+                msg="[ share_parsed_base ] is only supported with the ini"
+                    " [ config_type ]"
+            )
+
+        stream = boolean(self._task.args.get('stream', False), strict=False)
+        stanza_key = self._task.args.get('stanza_key')
+        if stream:
+            if config_type != 'ini':
+                return False, dict(
+                    failed=True,
+                    msg="[ stream ] is only supported with the ini"
+                        " [ config_type ]"
+                )
+            if boolean(self._task.args.get('render_template', True),
+                       strict=False):
+                return False, dict(
+                    failed=True,
+                    msg="[ stream ] requires [ render_template ] to be false"
+                )
+            if source is None:
+                return False, dict(
+                    failed=True,
+                    msg="[ stream ] requires a [ src ]"
+                )
+            for key in STREAM_UNSUPPORTED_OPTIONS:
+                if boolean(self._task.args.get(key) or False, strict=False):
+                    return False, dict(
+                        failed=True,
+                        msg="[ stream ] can not be used with [ %s ]" % key
+                    )
+        elif stanza_key:
+            return False, dict(
+                failed=True,
+                msg="[ stanza_key ] requires [ stream ]"
+            )
+
+        try:
+            cache_size = int(self._task.args.get('cache_size', CACHE_SIZE))
+        except (TypeError, ValueError):
+            return False, dict(
+                failed=True,
+                msg="[ cache_size ] must be a number of megabytes"
+            )
+
         yml_multilines = self._task.args.get('yml_multilines', False)
         block_end_string = self._task.args.get('block_end_string')
         block_start_string = self._task.args.get('block_start_string')
@@ -705,6 +944,7 @@ class ActionModule(ActionBase):
 
         return True, dict(
             source=source,
+            content=content,
             dest=user_dest,
             config_overrides=self._task.args.get('config_overrides', {}),
             config_type=config_type,
@@ -713,6 +953,11 @@ class ActionModule(ActionBase):
             ignore_none_type=ignore_none_type,
             default_section=default_section,
             yml_multilines=yml_multilines,
+            share_parsed_base=share_parsed_base,
+            cache_dir=self._task.args.get('cache_dir'),
+            cache_size=cache_size,
+            stream=stream,
+            stanza_key=stanza_key,
             remote_src=remote_src,
             block_end_string=block_end_string,
             block_start_string=block_start_string,
@@ -721,93 +966,464 @@ class ActionModule(ActionBase):
         )
 
     def resultant_ini_as_dict(self, resultant_dict, return_dict=None):
-        if not return_dict:
-            return_dict = {}
+        return _plugin_utils('config_merge').ini_as_dict(
+            resultant_dict, return_dict
+        )
 
-        for key, value in resultant_dict.items():
-            if not value:
-                continue
-            key = key.split(STRIP_MARKER)[0]
-            if isinstance(value, (dict, MultiKeyDict)):
-                return_dict[key] = self.resultant_ini_as_dict(value)
-            else:
-                return_dict[key] = value
+    def _fetch_remote_source(self, source):
+        """Return a file on the remote host fetched to the controller.
+
+        The connection plugin fetches the file straight into a controller
+        side temporary file, which is returned opened for reading and
+        already removed, so it goes away once it is closed. None is returned
+        when privilege escalation is in use, as the connection fetches files
+        as the remote user, or when the file can not be fetched.
+
+        :param source: ``str``
+        :returns: ``file`` || ``None``
+        """
+        if self._connection.become:
+            return None
+        fd, local_source = tmpfilelib.mkstemp(dir=C.DEFAULT_LOCAL_TMP)
+        os.close(fd)
+        try:
+            self._connection.fetch_file(source, local_source)
+            return open(local_source, 'r', encoding='utf-8')
+        except errors.AnsibleError:
+            return None
+        finally:
+            os.remove(local_source)
+
+    def _read_remote_source(self, source, task_vars):
+        """Return the text content of a file on the remote host.
 
-        return return_dict
+        The file is fetched and read once, so only a single text copy of
+        the file is kept in memory instead of the base64 encoded, decoded
+        and text copies a slurp requires. When the file can not be fetched,
+        see _fetch_remote_source, the slurp module is used.
+
+        :param source: ``str``
+        :param task_vars: ``dict``
+        :returns: ``str``
+        """
+        source_file = self._fetch_remote_source(source)
+        if source_file is not None:
+            with source_file:
+                return source_file.read()
+
+        slurpee = self._execute_module(
+            module_name='slurp',
+            module_args=dict(src=source),
+            task_vars=task_vars
+        )
+        if slurpee.get('failed'):
+            raise errors.AnsibleActionFail(
+                slurpee.get('msg', 'Failed to read %s' % source)
+            )
+        return base64.b64decode(slurpee['content']).decode('utf-8')
 
     def _check_templar(self, data, extra):
         if boolean(self._task.args.get('render_template', True)):
-            templar = self._templar
-            t_vars = {
-                'searchpath': extra['searchpath']
-            }
             overrides = {
                 k: extra[k] for k in [
                     'variable_start_string', 'variable_end_string',
                     'block_start_string', 'block_end_string'
                 ] if extra.get(k)
             }
-            template_kwargs = dict(
-                preserve_trailing_newlines=True,
-                escape_backslashes=False,
-                overrides=overrides
+            return _render_template(
+                self._templar, data, extra['searchpath'], overrides
             )
-
-            if LooseVersion(__ansible_version__) >= LooseVersion('2.19'):
-                data = trust_as_template(data)
-
-            if LooseVersion(__ansible_version__) < LooseVersion('2.17'):
-                template_kwargs['convert_data'] = False
-
-            if hasattr(templar, 'copy_with_new_env'):
-                templar = templar.copy_with_new_env(**t_vars)
-                return templar.template(data, **template_kwargs)
-            else:
-                with templar.set_temporary_context(**t_vars):
-                    return templar.template(data, **template_kwargs)
         else:
             return data
 
-    def run(self, tmp=None, task_vars=None):
-        """Run the method"""
+    def _referenced_variables(self, template_data, _vars):
+        """Return the names of the variables a template references.
 
-        if not tmp:
+        None is returned when the result of the template could depend on
+        more than these variables: templates including other templates,
+        using lookups or reaching into hostvars, or setting delimiters
+        from a ``#jinja2:`` header.
+
+        :param template_data: ``str``
+        :param _vars: ``dict``
+        :returns: ``set`` || ``None``
+        """
+        if (_vars['content'] is not None or
+                not boolean(self._task.args.get('render_template', True))):
+            return set()
+        if template_data.startswith('#jinja2:'):
+            return None
+
+        delimiters = {
+            k: _vars[k] for k in [
+                'variable_start_string', 'variable_end_string',
+                'block_start_string', 'block_end_string'
+            ] if _vars.get(k)
+        }
+        try:
+            environment = _parse_environment(**delimiters)
+            ast = environment.parse(template_data)
+        except Exception:
+            return None
+
+        if list(jinja2_meta.find_referenced_templates(ast)):
+            return None
+        names = jinja2_meta.find_undeclared_variables(ast)
+        if names & UNCACHEABLE_TEMPLATE_NAMES:
+            return None
+        return names - set(environment.globals) - ANSIBLE_TEMPLATE_GLOBALS
+
+    def _render_fingerprint(self, template_data, _vars, temp_vars):
+        """Return a fingerprint of everything a merged result depends on.
+
+        Hosts sharing a fingerprint render and merge to the same result. Only
+        the variables referenced by the template are resolved and included,
+        so hosts of a group rendering a template which only uses group level
+        variables share the same fingerprint.
+
+        :param template_data: ``str``
+        :param _vars: ``dict``
+        :param temp_vars: ``dict``
+        :returns: ``str`` || ``None``
+        """
+        names = self._referenced_variables(template_data, _vars)
+        if names is None:
+            return None
+
+        variables = dict()
+        for name in sorted(names):
+            if name not in temp_vars:
+                variables[name] = None
+                continue
             try:
-                remote_user = self._get_remote_user()
+                variables[name] = _fingerprint_value(
+                    self._templar.template(temp_vars[name])
+                )
             except Exception:
-                remote_user = task_vars.get('ansible_user')
-                if not remote_user:
-                    remote_user = task_vars.get('ansible_ssh_user')
-                if not remote_user:
-                    remote_user = self._play_context.remote_user
+                return None
+
+        fingerprint = dict(
+            template=hashlib.sha256(to_bytes(template_data)).hexdigest(),
+            variables=variables,
+            config_overrides=_fingerprint_value(_vars['config_overrides']),
+            render_template=boolean(
+                self._task.args.get('render_template', True)
+            )
+        )
+        for key in ('config_type', 'list_extend', 'ignore_none_type',
+                    'default_section', 'yml_multilines',
+                    'variable_start_string', 'variable_end_string',
+                    'block_start_string', 'block_end_string'):
+            fingerprint[key] = _fingerprint_value(_vars.get(key))
+
+        return hashlib.sha256(
+            to_bytes(json.dumps(fingerprint, sort_keys=True))
+        ).hexdigest()
+
+    def _get_merge_cache(self, _vars):
+        """Return the persistent merge cache when cache_dir is set.
+
+        :param _vars: ``dict``
+        :returns: ``ResultCache`` || ``None``
+        """
+        if not _vars.get('cache_dir'):
+            return None
+        return ResultCache(
+            path=os.path.join(
+                os.path.expanduser(_vars['cache_dir']), 'merged'
+            ),
+            max_size=_vars['cache_size'] * 1024 * 1024
+        )
+
+    def _merge(self, resultant, config_overrides, _vars, cache=True):
+        """Merge overrides into a resultant with the config_type merger.
+
+        When cache_dir is set, the result is looked up in and stored into a
+        persistent cache keyed by the resultant, the overrides and the
+        merge options, so unchanged files are not merged again by later
+        runs.
+
+        :param resultant: ``str`` || ``file``
+        :param config_overrides: ``dict`` || ``list``
+        :param _vars: ``dict``
+        :param cache: ``bool`` use the persistent cache when it is enabled
+        :returns: ``str``, ``dict``
+        """
+        type_merger = _config_type_merger(_vars['config_type'])
+        if isinstance(type_merger, str):
+            type_merger = getattr(self, type_merger)
+            merger_paths = ()
+        else:
+            merger_paths = (getattr(
+                sys.modules.get(type_merger.__module__), '__file__', None
+            ),)
+            type_merger = functools.partial(type_merger, self)
+
+        merge_cache = self._get_merge_cache(_vars) if cache else None
+        if merge_cache and all(merger_paths):
+            merge_key = dict(
+                resultant=_plugin_utils('config_merge').resultant_digest(
+                    resultant
+                ),
+                config_overrides=_fingerprint_value(config_overrides),
+                merger=_merger_digest(*merger_paths)
+            )
+            for key in ('config_type', 'list_extend', 'ignore_none_type',
+                        'default_section', 'yml_multilines'):
+                merge_key[key] = _fingerprint_value(_vars.get(key))
+            merge_key = hashlib.sha256(
+                to_bytes(json.dumps(merge_key, sort_keys=True))
+            ).hexdigest()
+            cached = merge_cache.get(merge_key)
+            if cached:
+                return cached
+        else:
+            merge_cache = None
+
+        merge_kwargs = dict(
+            config_overrides=config_overrides,
+            resultant=resultant,
+            list_extend=_vars.get('list_extend', True),
+            ignore_none_type=_vars.get('ignore_none_type', True),
+            default_section=_vars.get('default_section', 'DEFAULT'),
+            yml_multilines=_vars.get('yml_multilines', False)
+        )
+        if _vars.get('share_parsed_base'):
+            merge_kwargs['share_parsed_base'] = True
+        merged = type_merger(**merge_kwargs)
+        if merge_cache:
+            merge_cache.set(merge_key, *merged)
+        return merged
+
+    def _journal_path(self, _vars, task_vars):
+        key = '%s\0%s' % (task_vars.get('inventory_hostname'), _vars['dest'])
+        return os.path.join(
+            os.path.expanduser(self._task.args['cache_dir']),
+            'journal',
+            hashlib.sha256(to_bytes(key)).hexdigest()
+        )
+
+    def _journal_fingerprint(self, render_key):
+        """Return the journal fingerprint of a task.
+
+        It extends the render fingerprint with the task arguments, which
+        carry the file attributes given to the copy module.
+        """
+        return hashlib.sha256(
+            to_bytes(
+                json.dumps(
+                    [render_key, _fingerprint_value(self._task.args)],
+                    sort_keys=True
+                )
+            )
+        ).hexdigest()
+
+    def _stat_dest(self, dest, task_vars):
+        """Return the state of a destination in config_template_stat format."""
+        recorded = self._get_dest_stat(task_vars)
+        if dest in recorded:
+            return recorded[dest]
+
+        stat = self._execute_module(
+            module_name='stat',
+            module_args=dict(
+                path=dest,
+                follow=True,
+                get_checksum=True,
+                checksum_algorithm='sha1',
+                get_mime=False,
+                get_attributes=False
+            ),
+            task_vars=task_vars
+        ).get('stat', {})
+        if not stat.get('exists'):
+            return dict(exists=False)
+        return dict(
+            exists=True,
+            checksum=stat.get('checksum'),
+            mode=stat.get('mode'),
+            owner=stat.get('pw_name'),
+            group=stat.get('gr_name'),
+            uid=stat.get('uid'),
+            gid=stat.get('gid'),
+            size=stat.get('size')
+        )
+
+    def _check_journal(self, journal_key, _vars, task_vars):
+        """Return a result when the journal shows the task is up to date.
+
+        The task is up to date when the journal of the previous run recorded
+        the same fingerprint for the destination and the destination still
+        holds the checksum written back then.
+
+        :param journal_key: ``str``
+        :param _vars: ``dict``
+        :param task_vars: ``dict``
+        :returns: ``dict`` || ``None``
+        """
+        try:
+            with open(self._journal_path(_vars, task_vars), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('fingerprint') != journal_key:
+            return None
+
+        dest_stat = self._stat_dest(_vars['dest'], task_vars)
+        if not self._dest_is_current(dest_stat, entry.get('checksum')):
+            return None
+
+        rc = dict(
+            changed=False,
+            dest=_vars['dest'],
+            checksum=entry['checksum']
+        )
+        if self._play_context.diff:
+            mods = {'added': {}, 'removed': {}, 'changed': {}}
+            rc['diff'] = [
+                {'prepared': json.dumps(mods, indent=4, sort_keys=True)}
+            ]
+        return rc
+
+    def _write_journal(self, journal_key, _vars, task_vars, checksum):
+        journal_path = self._journal_path(_vars, task_vars)
+        journal_dir = os.path.dirname(journal_path)
+        try:
+            os.makedirs(journal_dir, exist_ok=True)
+            fd, tmp_path = tmpfilelib.mkstemp(dir=journal_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(
+                    dict(
+                        host=task_vars.get('inventory_hostname'),
+                        dest=_vars['dest'],
+                        fingerprint=journal_key,
+                        checksum=checksum
+                    ),
+                    f
+                )
+            os.replace(tmp_path, journal_path)
+        except OSError:
+            pass
+
+    def _get_remote_user_name(self, task_vars):
+        return _plugin_utils('run_state').remote_user(self, task_vars)
+
+    def _staging_marker(self, task_vars, remote_user):
+        """Return the controller side marker file for a host staging dir.
+
+        The marker lives in the local temporary directory of the running
+        ansible process, which is shared by all of the forks, so every
+        config_template task connecting to the same host, port and remote
+        user, delegated or not, resolves the same remote staging directory.
+        """
+        run_state = _plugin_utils('run_state')
+        return run_state.state_path(
+            'staging',
+            run_state.connection_target(self, task_vars, remote_user)
+        )
+
+    def _reuse_tmp_path(self, task_vars, remote_user, task_tmp=None):
+        """Return a remote staging directory shared across tasks.
+
+        Forks connecting to the same target can get here at once. The marker
+        is published with a hard link, which fails when it already exists, so
+        a single staging directory wins and the others are removed.
+
+        :param task_tmp: ``str`` temporary directory the task already created
+        """
+        marker = self._staging_marker(task_vars, remote_user)
+        try:
+            with open(marker, 'r') as f:
+                tmp = f.read().strip()
+        except FileNotFoundError:
+            tmp = None
+
+        if tmp:
+            self._connection._shell.tmpdir = tmp
+        else:
             try:
                 tmp = self._make_tmp_path(remote_user)
             except TypeError:
                 tmp = self._make_tmp_path()
-
-        _status, _vars = self._load_options_and_status(task_vars=task_vars)
-        if not _status:
-            return _vars
-
-        temp_vars = task_vars.copy()
-        template_host = temp_vars['template_host'] = os.uname()[1]
-        source = temp_vars['template_path'] = _vars['source']
-
+            fd, tmp_marker = tmpfilelib.mkstemp(dir=os.path.dirname(marker))
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(tmp)
+                os.link(tmp_marker, marker)
+            except FileExistsError:
+                self._remove_tmp_path(tmp, force=True)
+                with open(marker, 'r') as f:
+                    tmp = f.read().strip()
+                self._connection._shell.tmpdir = tmp
+            finally:
+                os.unlink(tmp_marker)
+
+        if task_tmp and task_tmp != tmp:
+            # A module run earlier by the task created its own directory,
+            # which is used instead of a new one and removed with the task.
+            # The shell of the connection, kept across the items of a loop,
+            # may also still point to the shared directory.
+            self._connection._shell.tmpdir = task_tmp
+            self._cleanup_remote_tmp = True
+            return task_tmp
+        elif not self._is_pipelining_enabled('new'):
+            # Without pipelining the copy module itself is written to the
+            # staging directory under a fixed name, so tasks running at the
+            # same time each get their own directory within the shared one.
+            tmp = self._connection._shell.join_path(
+                tmp, 'config_template-tmp-%s' % uuid.uuid4().hex
+            )
+            rc = self._low_level_execute_command(
+                'mkdir -m 700 %s' % self._connection._shell.quote(tmp),
+                sudoable=False
+            )
+            if rc.get('rc', 0) != 0:
+                raise errors.AnsibleError(
+                    'Failed to create the staging directory %s: %s' % (
+                        tmp, rc.get('stderr')
+                    )
+                )
+            self._connection._shell.tmpdir = tmp
+            self._cleanup_remote_tmp = True
+            return tmp
+
+        # The staging directory outlives this task, make sure the action
+        # cleanup does not remove it.
+        self._cleanup_remote_tmp = False
+        return tmp
+
+    def _cleanup_reused_tmp_path(self, task_vars, remote_user):
+        """Remove the remote staging directory shared across tasks."""
+        marker = self._staging_marker(task_vars, remote_user)
+        try:
+            with open(marker, 'r') as f:
+                tmp = f.read().strip()
+        except FileNotFoundError:
+            return dict(changed=False)
+
+        # Removing the staging directory is housekeeping and is not reported
+        # as a change, in the same way ansible handles its own tmp dirs.
+        self._remove_tmp_path(tmp, force=True)
+        os.remove(marker)
+        return dict(changed=False, path=tmp)
+
+    def _set_template_vars(self, source, temp_vars, task_vars):
+        """Add the template_* and ansible_managed variables of a source.
+
+        :param source: ``str``
+        :param temp_vars: ``collections.ChainMap``
+        :param task_vars: ``dict``
+        """
+        template_vars = _plugin_utils('template_vars')
+        template_host = temp_vars['template_host']
+        temp_vars['template_path'] = source
         try:
-            mtime = os.path.getmtime(source)
-            temp_vars['template_mtime'] = datetime.datetime.fromtimestamp(
-                mtime
+            temp_vars.update(
+                template_vars.template_metadata(source, template_host)
             )
-            try:
-                template_uid = temp_vars['template_uid'] = pwd.getpwuid(
-                    os.stat(source).st_uid
-                ).pw_name
-            except Exception:
-                template_uid = temp_vars['template_uid'] = os.stat(
-                    source
-                ).st_uid
         except (PermissionError, FileNotFoundError):
-            local_task_vars = temp_vars.copy()
+            local_task_vars = temp_vars.new_child()
             if not boolean(self._task.args.get('remote_src', False),
                            strict=False):
                 local_task_vars['connection'] = 'local'
@@ -816,31 +1432,58 @@ class ActionModule(ActionBase):
                 module_args=dict(path=source),
                 task_vars=local_task_vars
             )
-            mtime = stat['stat']['mtime']
-            temp_vars['template_mtime'] = datetime.datetime.fromtimestamp(
-                mtime
+            if not stat.get('stat', {}).get('exists'):
+                raise errors.AnsibleFileNotFound(
+                    "Could not find or access the [ src ] %s" % source
+                )
+            temp_vars.update(
+                template_vars.build_template_metadata(
+                    source=source,
+                    mtime=stat['stat']['mtime'],
+                    template_uid=stat['stat']['uid'],
+                    template_host=template_host
+                )
             )
-            template_uid = stat['stat']['uid']
 
-        managed_default = C.DEFAULT_MANAGED_STR
-        managed_str = managed_default.format(
-            host=template_host,
-            uid=template_uid,
-            file=to_bytes(source)
-        )
+    def _open_source(self, _vars):
+        """Return the source file opened for reading when it can be streamed.
 
-        temp_vars['ansible_managed'] = time.strftime(
-            managed_str,
-            time.localtime(mtime)
-        )
-        temp_vars['template_fullpath'] = os.path.abspath(source)
-        temp_vars['template_run_date'] = datetime.datetime.now()
+        A source which is not rendered is parsed straight from the file,
+        without reading it into memory first. A remote source is parsed from
+        the file it is fetched to. None is returned when the source has to
+        be read, because it is rendered or fingerprinted, or when it can not
+        be opened or fetched.
+
+        :param _vars: ``dict``
+        :returns: ``file`` || ``None``
+        """
+        for key in ('render_dedup', 'run_journal'):
+            if boolean(self._task.args.get(key, False), strict=False):
+                return None
+        if boolean(self._task.args.get('render_template', True)):
+            return None
+
+        if boolean(self._task.args.get('remote_src', False), strict=False):
+            return self._fetch_remote_source(_vars['source'])
+        try:
+            return open(_vars['source'], 'r')
+        except (PermissionError, FileNotFoundError):
+            return None
 
+    def _read_template(self, source, task_vars):
+        """Return the text content of a template source."""
         try:
-            with open(source, 'r') as f:
-                template_data = to_text(f.read())
+            if boolean(self._task.args.get('remote_src', False),
+                       strict=False):
+                return self._read_remote_source(
+                    source=source,
+                    task_vars=task_vars
+                )
+            else:
+                with open(source, 'r') as f:
+                    return to_text(f.read())
         except (PermissionError, FileNotFoundError):
-            local_temp_vars = task_vars.copy()
+            local_temp_vars = collections.ChainMap({}, task_vars)
             if not boolean(self._task.args.get('remote_src', False),
                            strict=False):
                 local_temp_vars['connection'] = 'local'
@@ -849,91 +1492,75 @@ class ActionModule(ActionBase):
                 module_args=dict(src=source),
                 task_vars=local_temp_vars
             )
-            template_data = base64.b64decode(
+            return base64.b64decode(
                 template_data_slurpee['content']
             ).decode('utf-8')
 
-        self._templar.available_variables = temp_vars
-
-        if self._task.args.get('content'):
-            resultant = template_data
-        else:
-            resultant = self._check_templar(data=template_data, extra=_vars)
+    def _load_template(self, _vars, task_vars):
+        """Read the template and set the template variables up.
 
-        type_merger = getattr(self, CONFIG_TYPES.get(_vars['config_type']))
-        resultant, config_base = type_merger(
-            config_overrides=_vars['config_overrides'],
-            resultant=resultant,
-            list_extend=_vars.get('list_extend', True),
-            ignore_none_type=_vars.get('ignore_none_type', True),
-            default_section=_vars.get('default_section', 'DEFAULT'),
-            yml_multilines=_vars.get('yml_multilines', False)
-        )
-
-        changed = False
-        config_new = None
-        if self._play_context.diff:
-            slurpee = self._execute_module(
-                module_name='slurp',
-                module_args=dict(src=_vars['dest']),
+        :param _vars: ``dict``
+        :param task_vars: ``dict``
+        :returns: ``ChainMap`` of the template variables, the source
+                  ``file`` when it is not rendered and the template ``str``
+        """
+        # The template variables are layered on top of the task variables,
+        # which can hold thousands of keys with a large inventory, rather
+        # than added to a copy of them.
+        temp_vars = collections.ChainMap({}, task_vars)
+        temp_vars['template_host'] = os.uname()[1]
+        if _vars['content'] is None:
+            self._set_template_vars(
+                source=_vars['source'],
+                temp_vars=temp_vars,
                 task_vars=task_vars
             )
-            if 'content' in slurpee:
-                dest_data = base64.b64decode(
-                    slurpee['content']).decode('utf-8')
-                resultant_dest = self._check_templar(data=dest_data, extra=_vars)
-                type_merger = getattr(self,
-                                      CONFIG_TYPES.get(_vars['config_type']))
-                _, config_new = type_merger(
-                    config_overrides={},
-                    resultant=resultant_dest,
-                    list_extend=_vars.get('list_extend', True),
-                    ignore_none_type=_vars.get('ignore_none_type', True),
-                    default_section=_vars.get('default_section', 'DEFAULT'),
-                    yml_multilines=_vars.get('yml_multilines', False)
+            source_file = self._open_source(_vars)
+            if source_file is None:
+                template_data = self._read_template(
+                    source=_vars['source'],
+                    task_vars=task_vars
                 )
+            else:
+                template_data = None
+        else:
+            source_file = None
+            # Content is kept in memory, there is no template file to
+            # inspect or read back.
+            template_data = _vars['content']
+        temp_vars['template_run_date'] = datetime.datetime.now()
 
-            # Compare source+overrides with dest to look for changes and
-            # build diff
-            if isinstance(config_base, dict):
-                if not config_new:
-                    config_new = dict()
-                cmp_dicts = DictCompare(
-                    self.resultant_ini_as_dict(resultant_dict=config_new),
-                    self.resultant_ini_as_dict(resultant_dict=config_base)
-                )
-                mods, changed = cmp_dicts.get_changes()
-            elif isinstance(config_base, list):
-                if not config_new:
-                    config_new = list()
-                mods = {
-                    'added': [
-                        i for i in config_new
-                        if i not in config_base
-                    ],
-                    'removed': [
-                        i for i in config_base
-                        if i not in config_new
-                    ],
-                    'changed': [
-                        i for i in (config_base + config_new)
-                        if i not in config_base or i not in config_new
-                    ]
-                }
-                changed = len(mods['changed']) > 0
+        self._templar.available_variables = temp_vars
+        return temp_vars, source_file, template_data
+
+    def _execute_copy(self, tmp, resultant, _vars, task_vars, staged=None,
+                      remote_name='source'):
+        """Transfer the resultant file and run the copy module.
 
+        :param staged: ``str`` local file already holding the resultant
+        :param remote_name: ``str`` name of the file in the staging directory
+        """
         # run the copy module
         new_module_args = self._task.args.copy()
+        if boolean(self._task.args.get('reuse_tmp', False), strict=False):
+            # The staging directory is shared by every task connecting to
+            # the same target, which may be running at the same time.
+            remote_name = '%s-%s' % (remote_name, uuid.uuid4().hex)
         # Access to protected method is unavoidable in Ansible
-        transferred_data = self._transfer_data(
-            self._connection._shell.join_path(tmp, 'source'),
-            resultant
-        )
+        remote_path = self._connection._shell.join_path(tmp, remote_name)
+        if staged is None:
+            transferred_data = self._transfer_data(remote_path, resultant)
+        else:
+            transferred_data = self._transfer_file(staged, remote_path)
+        self._timer.count('transferred', resultant)
+        self._timer.lap('transfer')
         new_module_args.update(
             dict(
                 src=transferred_data,
                 dest=_vars['dest'],
-                _original_basename=os.path.basename(source),
+                _original_basename=os.path.basename(
+                    _vars['source'] or _vars['dest']
+                ),
                 follow=True,
             ),
         )
@@ -959,20 +1586,698 @@ class ActionModule(ActionBase):
         # remove render enablement option
         new_module_args.pop('render_template', None)
 
+        # remove render deduplication and cache options
+        new_module_args.pop('render_dedup', None)
+        new_module_args.pop('cache_dir', None)
+        new_module_args.pop('cache_size', None)
+        new_module_args.pop('run_journal', None)
+
+        # remove staging directory options
+        new_module_args.pop('reuse_tmp', None)
+        new_module_args.pop('cleanup_tmp', None)
+
+        # remove parsing options
+        new_module_args.pop('share_parsed_base', None)
+        new_module_args.pop('stream', None)
+        new_module_args.pop('stanza_key', None)
+
+        # remove profiling options
+        new_module_args.pop('profile', None)
+        new_module_args.pop('profile_dir', None)
+        new_module_args.pop('profile_memory', None)
+
+        # remove batch options
+        new_module_args.pop('files', None)
+        new_module_args.pop('batch_workers', None)
+
         # Run the copy module
         rc = self._execute_module(
             module_name='copy',
             module_args=new_module_args,
             task_vars=task_vars
         )
+        self._timer.lap('copy')
+        return rc
+
+    def _add_timings(self, rc, _vars, task_vars):
+        """Add the phase timings of the task to its result, when profiled.
+
+        :param rc: ``dict``
+        :param _vars: ``dict``
+        :param task_vars: ``dict``
+        :returns: ``dict``
+        """
+        if self._timer.enabled:
+            rc['config_template_timings'] = self._timer.result(
+                host=task_vars.get('inventory_hostname'),
+                template=_vars['source'] or '<content>',
+                dest=_vars['dest'],
+                config_type=_vars['config_type']
+            )
+        return rc
+
+    def _dest_stat_path(self, task_vars):
+        run_state = _plugin_utils('run_state')
+        return run_state.state_path(
+            run_state.DEST_STAT_STATE,
+            run_state.connection_target(
+                self, task_vars, self._get_remote_user_name(task_vars)
+            )
+        )
+
+    def _get_dest_stat(self, task_vars):
+        """Return the destinations recorded by config_template_stat.
+
+        The snapshot is ignored by delegated tasks, which write their
+        destination on another host than the one it was taken on.
+        """
+        if self._task.delegate_to:
+            return {}
+        return _plugin_utils('run_state').load_state(
+            self._dest_stat_path(task_vars)
+        )
+
+    def _attributes_comparable(self):
+        """Return True when the requested file attributes can be compared.
+
+        SELinux contexts, file attributes, symbolic modes and "preserve" are
+        left to the copy module.
+
+        :returns: ``bool``
+        """
+        for key in ('seuser', 'serole', 'setype', 'selevel', 'attributes',
+                    'attr'):
+            if self._task.args.get(key) is not None:
+                return False
+
+        mode = self._task.args.get('mode')
+        return mode is None or isinstance(mode, int) or str(mode).isdigit()
+
+    def _check_mode_fast_path(self):
+        """Return True when check mode can be answered on the controller."""
+        return self._task.check_mode and self._attributes_comparable()
+
+    def _get_tmp_path(self, task_vars):
+        """Create, or reuse, the remote staging directory of the task.
+
+        Without pipelining, a module run earlier by the task, like the slurp
+        of the diff or the stat of the destination, already created the
+        temporary directory of the task, which is then used as is.
+        """
+        task_tmp = self._connection._shell.tmpdir
+        remote_user = self._get_remote_user_name(task_vars)
+        if boolean(self._task.args.get('reuse_tmp', False), strict=False):
+            return self._reuse_tmp_path(task_vars, remote_user, task_tmp)
+        if task_tmp:
+            return task_tmp
+        try:
+            return self._make_tmp_path(remote_user)
+        except TypeError:
+            return self._make_tmp_path()
+
+    def _dest_is_current(self, dest_stat, checksum):
+        """Return True when a recorded destination matches the resultant.
+
+        Only the checksum, mode, owner and group can be compared, the
+        destination is never considered current when other file attributes
+        are requested.
+
+        :param dest_stat: ``dict``
+        :param checksum: ``str``
+        :returns: ``bool``
+        """
+        if not dest_stat or not dest_stat.get('exists'):
+            return False
+        if dest_stat.get('checksum') != checksum:
+            return False
+        if not self._attributes_comparable():
+            return False
+
+        mode = self._task.args.get('mode')
+        if mode is not None:
+            if isinstance(mode, int):
+                mode = '%04o' % mode
+            else:
+                mode = '%04o' % int(str(mode), 8)
+            if mode != dest_stat.get('mode'):
+                return False
+
+        for key, id_key in (('owner', 'uid'), ('group', 'gid')):
+            value = self._task.args.get(key)
+            if value is not None and str(value) not in (
+                    str(dest_stat.get(key)), str(dest_stat.get(id_key))):
+                return False
+
+        return True
+
+    def _deliver(self, tmp, resultant, config_base, _vars, task_vars,
+                 staged=None, remote_name='source', resultant_checksum=None):
+        """Compare the merged resultant with dest and copy it when needed.
+
+        :param tmp: ``str`` staging directory, created when needed
+        :param resultant: ``str``
+        :param config_base: ``dict`` || ``list``
+        :param _vars: ``dict``
+        :param task_vars: ``dict``
+        :param staged: ``str`` local file already holding the resultant
+        :param remote_name: ``str`` name of the file in the staging directory
+        :param resultant_checksum: ``str`` checksum of the staged file
+        :returns: ``dict`` result, ``str`` staging directory
+        """
+        changed = False
+        config_new = None
+        dest_data = None
+        # Streamed files are not parsed as a whole, they have no diff.
+        diff = self._play_context.diff and config_base is not None
+        if diff:
+            slurpee = self._execute_module(
+                module_name='slurp',
+                module_args=dict(src=_vars['dest']),
+                task_vars=task_vars
+            )
+            self._timer.lap('diff_slurp')
+            if 'content' in slurpee:
+                dest_data = base64.b64decode(
+                    slurpee['content']).decode('utf-8')
+                self._timer.count('dest', dest_data)
+                resultant_dest = self._check_templar(
+                    data=dest_data, extra=_vars
+                )
+                # The destination differs from host to host, caching its
+                # parse would only fill the cache.
+                _, config_new = self._merge(
+                    resultant=resultant_dest,
+                    config_overrides={},
+                    _vars=_vars,
+                    cache=False
+                )
+
+            # Compare source+overrides with dest to look for changes and
+            # build diff
+            mods, changed = _plugin_utils('config_merge').diff(
+                config_new, config_base
+            )
+            self._timer.lap('diff')
+
+        dest_stat = self._get_dest_stat(task_vars)
+        checksum = resultant_checksum or checksum_s(resultant)
+        if self._dest_is_current(dest_stat.get(_vars['dest']), checksum):
+            # The destination recorded by config_template_stat already holds
+            # the rendered content, there is nothing to transfer.
+            rc = dict(changed=False, dest=_vars['dest'], checksum=checksum)
+        elif self._check_mode_fast_path():
+            # In check mode the resultant is only compared with the
+            # destination, using the content read for the diff when the
+            # ownership and mode do not need to be checked, or a single stat.
+            if dest_data is not None and not any(
+                    self._task.args.get(i) is not None
+                    for i in ('mode', 'owner', 'group')):
+                dest_state = dict(exists=True, checksum=checksum_s(dest_data))
+            else:
+                dest_state = self._stat_dest(_vars['dest'], task_vars)
+            rc = dict(
+                changed=not self._dest_is_current(dest_state, checksum),
+                dest=_vars['dest'],
+                checksum=checksum
+            )
+        else:
+            self._timer.lap('dest_check')
+            if not tmp:
+                tmp = self._get_tmp_path(task_vars)
+                self._timer.lap('tmp')
+            rc = self._execute_copy(
+                tmp=tmp,
+                resultant=resultant,
+                _vars=_vars,
+                task_vars=task_vars,
+                staged=staged,
+                remote_name=remote_name
+            )
+            if (_vars['dest'] in dest_stat and not rc.get('failed') and
+                    not self._task.check_mode):
+                # Keep the recorded state accurate for later tasks writing
+                # the same destination.
+                dest_stat = dest_stat.copy()
+                dest_stat[_vars['dest']] = dict(
+                    exists=True,
+                    checksum=rc.get('checksum'),
+                    mode=rc.get('mode'),
+                    owner=rc.get('owner'),
+                    group=rc.get('group'),
+                    uid=rc.get('uid'),
+                    gid=rc.get('gid'),
+                    size=rc.get('size')
+                )
+                _plugin_utils('run_state').save_state(
+                    self._dest_stat_path(task_vars), dest_stat
+                )
+        self._timer.lap('dest_check')
         copy_changed = rc.get('changed')
         if not copy_changed:
             rc['changed'] = changed
 
-        if self._play_context.diff:
+        if diff:
             rc['diff'] = []
             rc['diff'].append(
                 {'prepared': json.dumps(mods, indent=4, sort_keys=True)})
-        if self._task.args.get('content'):
-            os.remove(_vars['source'])
+        return rc, tmp
+
+    def _merge_and_stage(self, resultant, _vars):
+        """Merge a file of a batch and write it to a local staging file.
+
+        This runs in the pool of the batch while the task moves on to the
+        next files, so it only uses its arguments and never the task.
+
+        :param resultant: ``str`` || ``file``
+        :param _vars: ``mappingproxy`` merge options of the file, see
+                      MERGE_OPTIONS
+        :returns: ``str``, ``dict``, ``str`` path of the staging file
+        """
+        if hasattr(resultant, 'read'):
+            with resultant:
+                resultant, config_base = self._merge(
+                    resultant=resultant,
+                    config_overrides=_vars['config_overrides'],
+                    _vars=_vars
+                )
+        else:
+            resultant, config_base = self._merge(
+                resultant=resultant,
+                config_overrides=_vars['config_overrides'],
+                _vars=_vars
+            )
+        fd, staged = tmpfilelib.mkstemp(dir=C.DEFAULT_LOCAL_TMP)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(to_bytes(resultant, errors='surrogate_or_strict'))
+        return resultant, config_base, staged
+
+    def _batch_error(self, exp):
+        """Return the result of a file of a batch which failed.
+
+        :param exp: ``Exception``
+        :returns: ``dict``
+        """
+        return dict(
+            failed=True,
+            msg="%s templating %s: %s" % (
+                type(exp).__name__,
+                self._task.args.get('src') or '[ content ]',
+                to_text(exp)
+            )
+        )
+
+    def _run_batch(self, tmp, task_vars):
+        """Template every file of the files option.
+
+        Every file takes the options of the task, updated with its own. The
+        templates are rendered in order by the task, as the templar can not
+        be shared, while a pool of batch_workers threads merges them and
+        writes them to local staging files. The files are then compared,
+        transferred and copied in order, so the results and the errors do
+        not depend on the scheduling of the pool.
+
+        :param tmp: ``str``
+        :param task_vars: ``dict``
+        :returns: ``dict``
+        """
+        # Only loaded by batch tasks.
+        import concurrent.futures
+
+        task_args = self._task.args
+        files = task_args['files']
+        if not isinstance(files, list) or not all(
+                isinstance(i, dict) for i in files):
+            return dict(
+                failed=True,
+                msg="[ files ] must be a list of dictionaries"
+            )
+        for key in BATCH_UNSUPPORTED_OPTIONS:
+            if any(boolean(i.get(key, False), strict=False)
+                   for i in [task_args] + files):
+                return dict(
+                    failed=True,
+                    msg="[ files ] can not be used with [ %s ]" % key
+                )
+        for index, item in enumerate(files):
+            for key in BATCH_TASK_OPTIONS:
+                if key in item:
+                    return dict(
+                        failed=True,
+                        msg="[ %s ] can only be set on the task, not on the"
+                            " [ files ] item %d" % (key, index)
+                    )
+        try:
+            width = int(task_args.get('batch_workers', BATCH_WORKERS))
+        except (TypeError, ValueError):
+            width = 0
+        if width < 1:
+            return dict(
+                failed=True,
+                msg="[ batch_workers ] must be a positive integer"
+            )
+
+        base_args = dict(
+            (k, v) for k, v in task_args.items()
+            if k not in ('files', 'batch_workers')
+        )
+        # The yaml dumper is patched before the pool can race on it.
+        _patch_ansible_dumper()
+        results = [None] * len(files)
+        pending = {}
+        delivered = set()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(width, len(files))) as executor:
+                for index, item in enumerate(files):
+                    self._task.args = dict(base_args, **item)
+                    try:
+                        _status, _vars = self._load_options_and_status(
+                            task_vars=task_vars
+                        )
+                        if not _status:
+                            results[index] = _vars
+                            continue
+                        _, source_file, template_data = self._load_template(
+                            _vars, task_vars
+                        )
+                        if source_file is not None:
+                            resultant = source_file
+                        elif _vars['content'] is not None:
+                            resultant = template_data
+                        else:
+                            resultant = self._check_templar(
+                                data=template_data,
+                                extra=_vars
+                            )
+                    except BATCH_FATAL_ERRORS:
+                        raise
+                    except Exception as exp:
+                        results[index] = self._batch_error(exp)
+                        continue
+                    merge_vars = types.MappingProxyType(
+                        dict((key, _vars[key]) for key in MERGE_OPTIONS)
+                    )
+                    pending[index] = (
+                        self._task.args,
+                        _vars,
+                        executor.submit(
+                            self._merge_and_stage, resultant, merge_vars
+                        )
+                    )
+
+                for index in sorted(pending):
+                    self._task.args, _vars, future = pending[index]
+                    try:
+                        resultant, config_base, staged = future.result()
+                    except BATCH_FATAL_ERRORS:
+                        raise
+                    except Exception as exp:
+                        results[index] = self._batch_error(exp)
+                        continue
+                    delivered.add(index)
+                    try:
+                        results[index], tmp = self._deliver(
+                            tmp,
+                            resultant,
+                            config_base,
+                            _vars,
+                            task_vars,
+                            staged=staged,
+                            remote_name='source-%d' % index
+                        )
+                    except BATCH_FATAL_ERRORS:
+                        raise
+                    except Exception as exp:
+                        results[index] = self._batch_error(exp)
+                    finally:
+                        os.unlink(staged)
+        finally:
+            self._task.args = task_args
+            # The files staged for the copies a fatal error prevented.
+            for index, (_, _, future) in pending.items():
+                if index in delivered or future.exception() is not None:
+                    continue
+                try:
+                    os.unlink(future.result()[2])
+                except OSError:
+                    pass
+
+        rc = dict(changed=False, results=results)
+        diffs = []
+        for item, result in zip(files, results):
+            result.setdefault('dest', item.get('dest'))
+            rc['changed'] = rc['changed'] or bool(result.get('changed'))
+            for diff in result.pop('diff', []):
+                diffs.append(dict(
+                    prepared='%s:\n%s' % (result['dest'], diff['prepared'])
+                ))
+        if self._play_context.diff:
+            rc['diff'] = diffs
+
+        failed = [i['dest'] for i in results if i.get('failed')]
+        if failed:
+            rc['failed'] = True
+            rc['msg'] = "Failed to template %d of %d [ files ]: %s" % (
+                len(failed), len(files), ', '.join(str(i) for i in failed)
+            )
+        return rc
+
+    def _run_stream(self, tmp, _vars, task_vars):
+        """Merge a stanza file one stanza at a time and copy it.
+
+        The source is memory mapped and the merged file written to a local
+        staging file as it is read, see config_merge.merge_stream, neither
+        is ever held in memory.
+
+        :param tmp: ``str``
+        :param _vars: ``dict``
+        :param task_vars: ``dict``
+        :returns: ``dict``
+        """
+        config_merge = _plugin_utils('config_merge')
+        fd, staged = tmpfilelib.mkstemp(dir=C.DEFAULT_LOCAL_TMP)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8',
+                           errors='surrogateescape', newline='') as f:
+                try:
+                    config_merge.merge_stream(
+                        config_overrides=_vars['config_overrides'],
+                        source=_vars['source'],
+                        fp=f,
+                        stanza_key=_vars['stanza_key'],
+                        ignore_none_type=_vars['ignore_none_type'],
+                        default_section=_vars['default_section']
+                    )
+                except config_merge.ConfigTemplateError as exp:
+                    raise errors.AnsibleModuleError(to_text(exp))
+                except OSError as exp:
+                    return dict(
+                        failed=True,
+                        msg="Can not read [ src ] %s: %s" % (
+                            _vars['source'], to_text(exp)
+                        )
+                    )
+            self._timer.count('merged', os.path.getsize(staged))
+            self._timer.lap('merge')
+            rc, tmp = self._deliver(
+                tmp,
+                None,
+                None,
+                _vars,
+                task_vars,
+                staged=staged,
+                resultant_checksum=checksum_file(staged)
+            )
+        finally:
+            os.unlink(staged)
+        return self._add_timings(rc, _vars, task_vars)
+
+    def run(self, tmp=None, task_vars=None):
+        """Run the method"""
+
+        profile_dir = (
+            self._task.args.get('profile_dir') or
+            os.environ.get(PROFILE_DIR_ENV)
+        )
+        if profile_dir:
+            return self._profiled_run(profile_dir, tmp, task_vars)
+        return self._run(tmp, task_vars)
+
+    def _profiled_run(self, profile_dir, tmp, task_vars):
+        """Run the task under cProfile, and tracemalloc when requested.
+
+        The statistics are written to profile_dir, on the controller, in a
+        ``.pstats`` file named after the host and the destination and, with
+        the profile_memory option, the top allocation sites in a
+        ``.allocations.txt`` file next to it.
+
+        :param profile_dir: ``str``
+        :param tmp: ``str``
+        :param task_vars: ``dict``
+        :returns: ``dict``
+        """
+        # Only loaded by the profiled tasks.
+        import cProfile
+        import tracemalloc
+
+        profile_dir = os.path.expanduser(profile_dir)
+        os.makedirs(profile_dir, exist_ok=True)
+        prefix = re.sub(
+            r'[^\w.-]',
+            '_',
+            '%s-%s-' % (
+                task_vars.get('inventory_hostname'),
+                os.path.basename(str(self._task.args.get('dest', '')))
+            )
+        )
+        fd, stats_path = tmpfilelib.mkstemp(
+            prefix=prefix, suffix='.pstats', dir=profile_dir
+        )
+        os.close(fd)
+
+        profile_memory = boolean(
+            self._task.args.get(
+                'profile_memory', os.environ.get(PROFILE_MEMORY_ENV, False)
+            ),
+            strict=False
+        )
+        trace_memory = profile_memory and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start(PROFILE_MEMORY_FRAMES)
+
+        profiler = cProfile.Profile()
+        try:
+            rc = profiler.runcall(self._run, tmp, task_vars)
+        finally:
+            profiler.dump_stats(stats_path)
+            if profile_memory:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                if trace_memory:
+                    tracemalloc.stop()
+
+        rc['config_template_profile'] = dict(pstats=stats_path)
+        if profile_memory:
+            allocations_path = '%s.allocations.txt' % stats_path[:-7]
+            with open(allocations_path, 'w') as f:
+                f.write('current: %d bytes, peak: %d bytes\n\n' % (
+                    current, peak
+                ))
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+                    f.write('%s\n' % stat)
+            rc['config_template_profile']['allocations'] = allocations_path
         return rc
+
+    def _run(self, tmp=None, task_vars=None):
+
+        if boolean(self._task.args.get('cleanup_tmp', False), strict=False):
+            return self._cleanup_reused_tmp_path(
+                task_vars=task_vars,
+                remote_user=self._get_remote_user_name(task_vars)
+            )
+
+        self._timer = PhaseTimer(
+            boolean(self._task.args.get('profile', False), strict=False)
+        )
+
+        if self._task.args.get('files'):
+            return self._run_batch(tmp, task_vars)
+
+        # The staging directory is only created by _deliver once a file
+        # has to be copied, tasks skipped by the journal, a recorded stat or
+        # the check mode fast path never touch the remote host for it.
+        _status, _vars = self._load_options_and_status(task_vars=task_vars)
+        if not _status:
+            return _vars
+        self._timer.lap('options')
+
+        if (boolean(self._task.args.get('run_journal', False), strict=False)
+                and not self._task.args.get('cache_dir')):
+            return dict(
+                failed=True,
+                msg="The [ run_journal ] option requires [ cache_dir ]"
+            )
+
+        if _vars['stream']:
+            return self._run_stream(tmp, _vars, task_vars)
+
+        temp_vars, source_file, template_data = self._load_template(
+            _vars, task_vars
+        )
+        self._timer.count('template', template_data or source_file)
+        self._timer.lap('template_read')
+
+        render_dedup = boolean(
+            self._task.args.get('render_dedup', False),
+            strict=False
+        )
+        run_journal = boolean(
+            self._task.args.get('run_journal', False),
+            strict=False
+        )
+        render_cache = render_key = journal_key = cached = None
+        if render_dedup or run_journal:
+            render_key = self._render_fingerprint(
+                template_data=template_data,
+                _vars=_vars,
+                temp_vars=temp_vars
+            )
+            self._timer.lap('fingerprint')
+
+        if run_journal and render_key:
+            journal_key = self._journal_fingerprint(render_key)
+            rc = self._check_journal(journal_key, _vars, task_vars)
+            self._timer.lap('journal')
+            if rc:
+                return self._add_timings(rc, _vars, task_vars)
+
+        if render_dedup and render_key:
+            render_cache = ResultCache(
+                os.path.join(C.DEFAULT_LOCAL_TMP, RENDER_CACHE_DIR)
+            )
+            cached = render_cache.get(render_key)
+            self._timer.lap('render_cache')
+
+        if cached:
+            resultant, config_base = cached
+        elif source_file is not None:
+            # The source is not rendered, it is parsed straight from the file.
+            with source_file:
+                resultant, config_base = self._merge(
+                    resultant=source_file,
+                    config_overrides=_vars['config_overrides'],
+                    _vars=_vars
+                )
+            self._timer.lap('merge')
+        else:
+            if _vars['content'] is not None:
+                resultant = template_data
+            else:
+                resultant = self._check_templar(
+                    data=template_data,
+                    extra=_vars
+                )
+            # Release the template before the rendered text is parsed.
+            template_data = None
+            self._timer.count('rendered', resultant)
+            self._timer.lap('render')
+
+            resultant, config_base = self._merge(
+                resultant=resultant,
+                config_overrides=_vars['config_overrides'],
+                _vars=_vars
+            )
+            self._timer.lap('merge')
+            if render_cache:
+                render_cache.set(render_key, resultant, config_base)
+                self._timer.lap('render_cache')
+        self._timer.count('merged', resultant)
+
+        rc, tmp = self._deliver(tmp, resultant, config_base, _vars, task_vars)
+
+        if (journal_key and not rc.get('failed') and rc.get('checksum') and
+                not self._task.check_mode):
+            self._write_journal(journal_key, _vars, task_vars, rc['checksum'])
+            self._timer.lap('journal')
+
+        return self._add_timings(rc, _vars, task_vars)
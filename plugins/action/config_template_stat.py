@@ -0,0 +1,57 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ansible.plugins.action import ActionBase
+
+from ansible_collections.openstack.config_template.plugins.plugin_utils \
+    import run_state
+
+__metaclass__ = type
+
+
+class ActionModule(ActionBase):
+    """Record the snapshot of config_template_stat for the current run.
+
+    The snapshot is stored in the run state of the connection target instead
+    of the facts of the host, so it never outlives the run through a fact
+    cache and follows the host a delegated task connects to.
+    """
+
+    _supports_check_mode = True
+
+    def run(self, tmp=None, task_vars=None):
+        """Run the method"""
+        if task_vars is None:
+            task_vars = dict()
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+        result.update(
+            self._execute_module(
+                module_name='openstack.config_template.config_template_stat',
+                module_args=self._task.args,
+                task_vars=task_vars
+            )
+        )
+        self._remove_tmp_path(self._connection._shell.tmpdir)
+        if result.get('failed'):
+            return result
+
+        path = run_state.state_path(
+            run_state.DEST_STAT_STATE,
+            run_state.connection_target(self, task_vars)
+        )
+        dest_stat = run_state.load_state(path)
+        dest_stat.update(result.get('dest_stat') or {})
+        run_state.save_state(path, dest_stat)
+        return result
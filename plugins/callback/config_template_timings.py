@@ -0,0 +1,204 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+DOCUMENTATION = r'''
+---
+name: config_template_timings
+type: aggregate
+short_description: Aggregate the phase timings of config_template tasks
+description:
+  - Collects the C(config_template_timings) reported by the
+    C(config_template) tasks run with C(profile=true), on every host, and
+    builds a latency histogram of every phase of every template.
+  - At the end of the playbook, the slowest templates and hosts are
+    displayed and a JSON report can be written.
+requirements:
+  - enable in configuration
+options:
+  top:
+    description: Number of templates and hosts to display.
+    type: int
+    default: 10
+    env:
+      - name: CONFIG_TEMPLATE_TIMINGS_TOP
+    ini:
+      - section: callback_config_template_timings
+        key: top
+  report:
+    description:
+      - Path of a JSON report to write with the histograms, the totals per
+        template and per host.
+    type: path
+    env:
+      - name: CONFIG_TEMPLATE_TIMINGS_REPORT
+    ini:
+      - section: callback_config_template_timings
+        key: report
+author:
+  - OpenStack-Ansible contributors
+'''
+
+import collections
+import json
+
+from ansible.plugins.callback import CallbackBase
+
+
+# Upper bounds, in seconds, of the buckets of the histograms.
+HISTOGRAM_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10
+)
+
+
+class Histogram(object):
+    """Latency histogram with fixed buckets.
+
+    Example Usage:
+    >>> histogram = Histogram()
+    >>> histogram.add(0.004)
+    >>> histogram.as_dict()
+    ... {'count': 1, 'sum': 0.004, 'max': 0.004,
+    ...  'buckets': {'0.005': 1}}
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for index, bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            index = len(HISTOGRAM_BUCKETS)
+        self.buckets[index] += 1
+
+    def as_dict(self):
+        bounds = [str(i) for i in HISTOGRAM_BUCKETS] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'buckets': {
+                bound: count
+                for bound, count in zip(bounds, self.buckets) if count
+            }
+        }
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'openstack.config_template.config_template_timings'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        # template -> phase -> Histogram
+        self.phases = collections.defaultdict(
+            lambda: collections.defaultdict(Histogram)
+        )
+        self.templates = collections.defaultdict(Histogram)
+        self.hosts = collections.defaultdict(Histogram)
+        self.bytes = collections.defaultdict(int)
+
+    def _record(self, result):
+        timings = result._result.get('config_template_timings')
+        if not timings:
+            return
+
+        template = timings.get('template')
+        host = timings.get('host') or result._host.get_name()
+        for phase, value in timings.get('phases', {}).items():
+            self.phases[template][phase].add(value)
+        self.templates[template].add(timings.get('total', 0))
+        self.hosts[host].add(timings.get('total', 0))
+        for name, value in timings.get('bytes', {}).items():
+            self.bytes[name] += value
+
+    def v2_runner_on_ok(self, result):
+        # The items of a loop are recorded by v2_runner_item_on_ok.
+        if 'results' not in result._result:
+            self._record(result)
+
+    def v2_runner_item_on_ok(self, result):
+        self._record(result)
+
+    def _display_top(self, title, histograms, top, phases=None):
+        """Display the entries taking the most time.
+
+        :param phases: ``dict`` of the phase histograms of every entry, the
+                       slowest phase of an entry is shown when it is given
+        """
+        phases = phases or {}
+        slowest = sorted(
+            histograms.items(), key=lambda i: i[1].sum, reverse=True
+        )[:top]
+        self._display.display('%s:' % title)
+        for name, histogram in slowest:
+            line = '  %s %.3fs over %d tasks, max %.3fs' % (
+                name, histogram.sum, histogram.count, histogram.max
+            )
+            entry_phases = phases.get(name)
+            if entry_phases:
+                phase, phase_histogram = max(
+                    entry_phases.items(), key=lambda i: i[1].sum
+                )
+                line += ', mostly %s %.3fs' % (phase, phase_histogram.sum)
+            self._display.display(line)
+
+    def report(self):
+        """Return the aggregated timings.
+
+        :returns: ``dict``
+        """
+        return {
+            'templates': {
+                template: dict(
+                    self.templates[template].as_dict(),
+                    phases={
+                        phase: histogram.as_dict()
+                        for phase, histogram in phases.items()
+                    }
+                )
+                for template, phases in self.phases.items()
+            },
+            'hosts': {
+                host: histogram.as_dict()
+                for host, histogram in self.hosts.items()
+            },
+            'bytes': dict(self.bytes)
+        }
+
+    def v2_playbook_on_stats(self, stats):
+        if not self.templates:
+            return
+
+        top = self.get_option('top')
+        self._display.banner('CONFIG_TEMPLATE TIMINGS')
+        self._display_top(
+            'Slowest templates', self.templates, top, phases=self.phases
+        )
+        self._display_top('Slowest hosts', self.hosts, top)
+
+        report = self.get_option('report')
+        if report:
+            with open(report, 'w') as f:
+                json.dump(self.report(), f, indent=2, sort_keys=True)
+            self._display.display('Report written to %s' % report)
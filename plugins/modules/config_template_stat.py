@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+DOCUMENTATION = r'''
+---
+module: config_template_stat
+short_description: Stat many config_template destinations at once
+description:
+  - Returns the checksum, mode, owner and group of a list of files in a
+    single module call and records them for the rest of the run.
+  - Later C(config_template) tasks writing one of these files compare the
+    rendered content with the recorded checksum and skip the transfer and
+    the copy module when nothing differs.
+  - The recorded values are a snapshot, files changed by other tasks after
+    this module ran should not be listed.
+  - The snapshot is kept on the controller, in the temporary directory of
+    the running ansible process, for the host, port and user the task
+    connects to. It is not a fact, so it is never reused by a later run,
+    and delegated C(config_template) tasks do not use it.
+options:
+  paths:
+    description:
+      - Paths of the files which are going to be written by
+        C(config_template).
+    type: list
+    elements: path
+    required: true
+author:
+  - OpenStack-Ansible contributors
+'''
+
+EXAMPLES = r'''
+- name: Gather the state of the configuration files
+  openstack.config_template.config_template_stat:
+    paths:
+      - /etc/nova/nova.conf
+      - /etc/nova/api-paste.ini
+'''
+
+RETURN = r'''
+dest_stat:
+  description:
+    - Map of path to its state. Paths which do not exist only have the
+      C(exists) key set to C(false).
+  returned: always
+  type: dict
+  sample:
+    /etc/nova/nova.conf:
+      exists: true
+      checksum: 2aae6c35c94fcfb415dbe95f408b9ce91ee846ed
+      mode: '0644'
+      owner: root
+      group: nova
+      uid: 0
+      gid: 64060
+      size: 1024
+'''
+
+import grp
+import os
+import pwd
+import stat
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils._text import to_bytes
+
+
+def _stat_path(module, path):
+    b_path = to_bytes(path, errors='surrogate_or_strict')
+    try:
+        st = os.stat(b_path)
+    except OSError:
+        return {'exists': False}
+
+    result = {
+        'exists': True,
+        'mode': '%04o' % stat.S_IMODE(st.st_mode),
+        'uid': st.st_uid,
+        'gid': st.st_gid,
+        'size': st.st_size,
+    }
+    try:
+        result['owner'] = pwd.getpwuid(st.st_uid).pw_name
+    except KeyError:
+        result['owner'] = st.st_uid
+    try:
+        result['group'] = grp.getgrgid(st.st_gid).gr_name
+    except KeyError:
+        result['group'] = st.st_gid
+
+    if stat.S_ISREG(st.st_mode) and os.access(b_path, os.R_OK):
+        result['checksum'] = module.sha1(path)
+    return result
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            paths=dict(type='list', elements='path', required=True),
+        ),
+        supports_check_mode=True
+    )
+
+    dest_stat = dict()
+    for path in module.params['paths']:
+        dest_stat[path] = _stat_path(module, path)
+
+    module.exit_json(changed=False, dest_stat=dest_stat)
+
+
+if __name__ == '__main__':
+    main()
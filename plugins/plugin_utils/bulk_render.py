@@ -0,0 +1,375 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Render config_template files for a whole inventory on the controller.
+
+Every host of the inventory gets its copy of a list of templated files,
+rendered with its variables, merged with its overrides and written to a
+local tree, ``<output>/<inventory_hostname>/<dest>``. Hosts are spread over
+a pool of processes, so the rendering scales with the cores of the
+controller. Nothing is run on the hosts.
+
+The files are described by a yaml file of specs:
+
+.. code-block:: yaml
+
+    - src: templates/nova.conf.j2
+      dest: /etc/nova/nova.conf
+      config_type: ini
+      config_overrides: "{{ nova_nova_conf_overrides }}"
+      hosts: nova_all
+
+``src`` is relative to the specs file. ``hosts`` is an inventory pattern,
+``all`` by default. ``list_extend``, ``ignore_none_type``,
+``default_section``, ``yml_multilines`` and ``render_template`` work like
+the options of the action plugin.
+"""
+
+import argparse
+import collections
+import collections.abc
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+from ansible.inventory.manager import InventoryManager
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+from ansible.vars.manager import VariableManager
+try:
+    from ansible.plugins.loader import init_plugin_loader
+except ImportError:
+    init_plugin_loader = None
+try:
+    from ansible.template import trust_as_template
+except ImportError:
+    trust_as_template = None
+
+try:
+    from ansible_collections.openstack.config_template.plugins.plugin_utils \
+        import config_merge
+    from ansible_collections.openstack.config_template.plugins.plugin_utils \
+        import template_vars
+except ImportError:
+    import config_merge
+    import template_vars
+
+
+# State of a worker process, see _init_worker.
+WORKER = {}
+
+# The controller, the template_host of every rendered file.
+TEMPLATE_HOST = os.uname()[1]
+
+
+def _plain(value):
+    """Return value with the ansible string and container types removed.
+
+    Templated values are tagged subclasses of the python types, which the
+    yaml safe dumper of the merge library does not represent.
+
+    :param value: ``object``
+    :returns: ``object``
+    """
+    if isinstance(value, collections.abc.Mapping):
+        return {_plain(k): _plain(v) for k, v in value.items()}
+    elif isinstance(value, tuple):
+        return tuple(_plain(i) for i in value)
+    elif isinstance(value, (set, frozenset)):
+        return set(_plain(i) for i in value)
+    elif isinstance(value, list):
+        return [_plain(i) for i in value]
+    elif isinstance(value, bool):
+        return bool(value)
+    for kind in (str, int, float):
+        if isinstance(value, kind):
+            return kind(value)
+    return value
+
+
+def _init_plugin_loader():
+    """Set the ansible plugin loader up once per process.
+
+    Forked workers inherit the loader of the parent and skip this.
+    """
+    if init_plugin_loader is not None and not WORKER.get('plugin_loader'):
+        init_plugin_loader()
+    WORKER['plugin_loader'] = True
+
+
+def load_specs(loader, specs_path):
+    """Load the specs file, its strings trusted as templates.
+
+    :param loader: ``DataLoader``
+    :param specs_path: ``str``
+    :returns: ``list``
+    """
+    if trust_as_template is not None:
+        specs = loader.load_from_file(specs_path, trusted_as_template=True)
+    else:
+        specs = loader.load_from_file(specs_path)
+    base_dir = os.path.dirname(os.path.abspath(specs_path))
+    for spec in specs:
+        for key in ('src', 'dest', 'config_type'):
+            if not spec.get(key):
+                raise ValueError(
+                    'Every spec of %s needs a [ %s ]' % (specs_path, key)
+                )
+        spec['src'] = os.path.join(base_dir, str(spec['src']))
+    return specs
+
+
+def merge_options(spec):
+    """Return the options of the merge library set by a spec.
+
+    :param spec: ``dict``
+    :returns: ``dict``
+    """
+    return dict(
+        list_extend=boolean(spec.get('list_extend', True), strict=False),
+        ignore_none_type=boolean(
+            spec.get('ignore_none_type', True), strict=False
+        ),
+        default_section=str(spec.get('default_section', 'DEFAULT')),
+        yml_multilines=boolean(spec.get('yml_multilines', False), strict=False)
+    )
+
+
+def _render(templar, data, searchpath):
+    """Render a template with the templar API of the running ansible.
+
+    :param templar: ``Templar``
+    :param data: ``str``
+    :param searchpath: ``list``
+    :returns: ``str``
+    """
+    kwargs = dict(preserve_trailing_newlines=True, escape_backslashes=False)
+    if trust_as_template is not None:
+        data = trust_as_template(data)
+    if hasattr(templar, 'copy_with_new_env'):
+        templar = templar.copy_with_new_env(searchpath=searchpath)
+        return templar.template(data, **kwargs)
+    with templar.set_temporary_context(searchpath=searchpath):
+        return templar.template(data, convert_data=False, **kwargs)
+
+
+def _init_worker(inventory, specs_path):
+    """Load the inventory and the specs once per worker process.
+
+    :param inventory: ``list``
+    :param specs_path: ``str``
+    """
+    _init_plugin_loader()
+    loader = DataLoader()
+    inventory_manager = InventoryManager(loader=loader, sources=inventory)
+    WORKER.update(
+        loader=loader,
+        inventory=inventory_manager,
+        variable_manager=VariableManager(
+            loader=loader, inventory=inventory_manager
+        ),
+        specs=load_specs(loader, specs_path)
+    )
+
+
+def host_path(root, host, dest):
+    """Return the path of the destination of a host in a local tree.
+
+    The tree is laid out as ``<root>/<host>/<dest>``. Destinations are
+    rendered from the variables of the hosts, so a destination leaving the
+    directory of its host, with ``..`` components, is rejected.
+
+    :param root: ``str``
+    :param host: ``str``
+    :param dest: ``str``
+    :returns: ``str``
+    """
+    base = os.path.normpath(os.path.join(root, host))
+    path = os.path.normpath(os.path.join(base, dest.lstrip(os.sep)))
+    if path == base or os.path.commonpath([base, path]) != base:
+        raise ValueError(
+            'The destination %s is outside of the directory of the host %s'
+            % (dest, host)
+        )
+    return path
+
+
+def _render_host(job):
+    """Render and write the files of a host, in a worker process.
+
+    :param job: ``tuple`` of the host name, the indexes of its specs and the
+                output directory
+    :returns: ``list``
+    """
+    host_name, indexes, output = job
+    loader = WORKER['loader']
+    host = WORKER['inventory'].get_host(host_name)
+    host_vars = WORKER['variable_manager'].get_vars(host=host)
+
+    results = []
+    for index in indexes:
+        spec = WORKER['specs'][index]
+        result = dict(
+            host=host_name,
+            spec=index,
+            src=spec['src'],
+            dest=spec['dest'],
+            config_type=str(spec['config_type'])
+        )
+        try:
+            variables = dict(host_vars)
+            variables.update(
+                template_vars.template_metadata(spec['src'], TEMPLATE_HOST),
+                template_host=TEMPLATE_HOST,
+                template_path=spec['src'],
+                template_run_date=datetime.datetime.now()
+            )
+            templar = Templar(loader=loader, variables=variables)
+            result['dest'] = str(templar.template(spec['dest']))
+            with open(spec['src']) as f:
+                resultant = f.read()
+            if boolean(spec.get('render_template', True), strict=False):
+                resultant = str(_render(
+                    templar,
+                    resultant,
+                    [os.path.dirname(spec['src'])]
+                ))
+            config_overrides = _plain(
+                templar.template(spec.get('config_overrides') or {})
+            )
+            merged, _ = config_merge.merge(
+                result['config_type'],
+                resultant,
+                config_overrides,
+                **merge_options(spec)
+            )
+
+            path = host_path(output, host_name, result['dest'])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = merged.encode('utf-8')
+            with open(path, 'wb') as f:
+                f.write(data)
+            result.update(
+                path=path,
+                size=len(data),
+                checksum=hashlib.sha1(data).hexdigest()
+            )
+        except Exception as exp:
+            result['error'] = '%s: %s' % (type(exp).__name__, exp)
+        results.append(result)
+    return results
+
+
+def render_inventory(inventory, specs_path, output, workers=None,
+                     limit=None):
+    """Render the specs for every matching host of an inventory.
+
+    The results are returned in the order of the hosts in the inventory,
+    whatever the order the workers finish in.
+
+    :param inventory: ``list`` of inventory sources
+    :param specs_path: ``str``
+    :param output: ``str``
+    :param workers: ``int``
+    :param limit: ``str`` inventory pattern
+    :returns: ``list``
+    """
+    _init_plugin_loader()
+    loader = DataLoader()
+    inventory_manager = InventoryManager(loader=loader, sources=inventory)
+    if limit:
+        inventory_manager.subset(limit)
+    specs = load_specs(loader, specs_path)
+
+    jobs = collections.OrderedDict(
+        (host.name, []) for host in inventory_manager.get_hosts('all')
+    )
+    for index, spec in enumerate(specs):
+        for host in inventory_manager.get_hosts(str(spec.get('hosts', 'all'))):
+            jobs[host.name].append(index)
+
+    output = os.path.abspath(output)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(inventory, specs_path)) as executor:
+        results = executor.map(
+            _render_host,
+            [(host, indexes, output) for host, indexes in jobs.items()
+             if indexes]
+        )
+        return [i for host_results in results for i in host_results]
+
+
+def main(argv=None):
+    """Entry point of the config-template-render command.
+
+    :param argv: ``list``
+    :returns: ``int``
+    """
+    parser = argparse.ArgumentParser(
+        prog='config-template-render',
+        description='Render config_template files for a whole inventory.'
+    )
+    parser.add_argument('specs', help='Yaml file of the files to render')
+    parser.add_argument(
+        '-i', '--inventory',
+        action='append',
+        required=True,
+        help='Inventory source, can be repeated'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        required=True,
+        help='Directory the files of every host are written to'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of worker processes, the number of cores by default'
+    )
+    parser.add_argument('-l', '--limit', help='Limit to an inventory pattern')
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    results = render_inventory(
+        args.inventory,
+        args.specs,
+        args.output,
+        workers=args.workers,
+        limit=args.limit
+    )
+    failed = [i for i in results if 'error' in i]
+    json.dump(
+        dict(
+            files=len(results),
+            failed=len(failed),
+            elapsed=round(time.monotonic() - start, 3),
+            results=results
+        ),
+        sys.stdout,
+        indent=4,
+        sort_keys=True
+    )
+    sys.stdout.write('\n')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
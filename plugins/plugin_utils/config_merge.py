@@ -0,0 +1,1228 @@
+# (c) 2015, Kevin Carter <kevin.carter@rackspace.com>
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Merge configuration overrides into ini, json and yaml files.
+
+This is the merge and diff engine of the config_template action plugin. It
+only depends on the python standard library and PyYAML, so it can be used
+without Ansible, as a library:
+
+>>> from config_merge import merge
+>>> merge('ini', '[nova]\\nkey = value\\n', {'nova': {'debug': True}})
+... ('[nova]\\nkey = value\\ndebug = True\\n\\n',
+...  {'nova': {'key': 'value', 'debug': 'True'}})
+
+or from the command line, through ``bin/config-template`` or by running this
+file:
+
+    config-template --config-type ini --overrides overrides.yml \\
+        --dest nova.conf nova.conf.base
+"""
+
+import argparse
+import collections
+import configparser
+import fnmatch
+import functools
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+
+from io import StringIO
+
+import yaml
+
+
+STRIP_MARKER = '__MARKER__'
+
+
+class ConfigTemplateError(Exception):
+    """Raised when overrides can not be merged into a file."""
+
+
+def iter_lines(resultant):
+    """Yield the lines of a resultant one at a time.
+
+    Files are iterated as they are read. Strings are sliced line by line,
+    avoiding the copy of the whole text a StringIO would hold.
+    """
+    if not isinstance(resultant, str):
+        yield from resultant
+        return
+
+    start = 0
+    while True:
+        end = resultant.find('\n', start)
+        if end == -1:
+            if start < len(resultant):
+                yield resultant[start:]
+            return
+        yield resultant[start:end + 1]
+        start = end + 1
+
+
+def resultant_digest(resultant):
+    """Return the sha256 digest of a resultant string or file."""
+    if isinstance(resultant, str):
+        return hashlib.sha256(
+            resultant.encode('utf-8', 'surrogateescape')
+        ).hexdigest()
+
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: resultant.read(65536), ''):
+        digest.update(chunk.encode('utf-8', 'surrogateescape'))
+    resultant.seek(0)
+    return digest.hexdigest()
+
+
+class IDumper(yaml.SafeDumper):
+    def increase_indent(self, flow=False, indentless=False):
+        return super(IDumper, self).increase_indent(flow, False)
+
+
+# Parsed ini bases shared by the parsers of a worker process, see
+# ConfigTemplateParser.read_shared.
+PARSED_INI_CACHE = collections.OrderedDict()
+PARSED_INI_CACHE_SIZE = 16
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    elif isinstance(value, tuple):
+        return tuple(_intern(i) for i in value)
+    return value
+
+
+class MultiKeyDict(dict):
+    """Dictionary class which supports duplicate keys.
+    This class allows for an item to be added into a standard python dictionary
+    however if a key is created more than once the dictionary will convert the
+    singular value to a python tuple. This tuple type forces all values to be a
+    string.
+    Example Usage:
+    >>> z = MultiKeyDict()
+    >>> z['a'] = 1
+    >>> z['b'] = ['a', 'b', 'c']
+    >>> z['c'] = {'a': 1}
+    >>> print(z)
+    ... {'a': 1, 'b': ['a', 'b', 'c'], 'c': {'a': 1}}
+    >>> z['a'] = 2
+    >>> print(z)
+    ... {'a': tuple(['1', '2']), 'c': {'a': 1}, 'b': ['a', 'b', 'c']}
+    """
+
+    def index(self, key):
+        for i, item in enumerate(self):
+            if item.startswith(key):
+                return i
+        raise ValueError(f"{key} not in MultiKeyDict")
+
+    def insert(self, index, key, value):
+        shadow = MultiKeyDict()
+        for i, (k, v) in enumerate(self.items()):
+            shadow[k] = v
+            if i == index:
+                shadow[key] = value
+        else:
+            if index >= len(self) and key not in shadow:
+                shadow[key] = value
+            return shadow
+
+
+    def __setitem__(self, key, value):
+        if key in self:
+            if isinstance(self[key], tuple):
+                items = self[key]
+                if str(value) not in items:
+                    value = items + tuple([str(value)])
+            elif isinstance(self[key], MultiKeyDict):
+                pass
+            else:
+                if str(self[key]) != str(value):
+                    value = tuple([str(self[key]), str(value)])
+
+        super(MultiKeyDict, self).__setitem__(key, value)
+
+
+class ConfigTemplateParser(configparser.RawConfigParser):
+    """configparser which supports multi key value.
+    The parser will use keys with multiple variables in a set as a multiple
+    key value within a configuration file.
+    Default Configuration file:
+    [DEFAULT]
+    things =
+        url1
+        url2
+        url3
+    other = 1,2,3
+    [section1]
+    key = var1
+    key = var2
+    key = var3
+    Example Usage:
+    >>> cp = ConfigTemplateParser(dict_type=MultiKeyDict)
+    >>> cp.read('/tmp/test.ini')
+    ... ['/tmp/test.ini']
+    >>> cp.get('DEFAULT', 'things')
+    ... \nurl1\nurl2\nurl3
+    >>> cp.get('DEFAULT', 'other')
+    ... '1,2,3'
+    >>> cp.set('DEFAULT', 'key1', 'var1')
+    >>> cp.get('DEFAULT', 'key1')
+    ... 'var1'
+    >>> cp.get('section1', 'key')
+    ... {'var1', 'var2', 'var3'}
+    >>> cp.set('section1', 'key', 'var4')
+    >>> cp.get('section1', 'key')
+    ... {'var1', 'var2', 'var3', 'var4'}
+    >>> with open('/tmp/test2.ini', 'w') as f:
+    ...     cp.write(f)
+    Output file:
+    [DEFAULT]
+    things =
+        url1
+        url2
+        url3
+    key1 = var1
+    other = 1,2,3
+    [section1]
+    key = var4
+    key = var1
+    key = var3
+    key = var2
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.ignore_none_type = bool(kwargs.pop('ignore_none_type', True))
+        self.default_section = str(kwargs.pop('default_section', 'DEFAULT'))
+        self.yml_multilines = bool(kwargs.pop('yml_multilines', False))
+        self._comment_prefixes = kwargs.pop('comment_prefixes', '/')
+        self._empty_lines_in_values = kwargs.get('allow_no_value', True)
+        self._strict = kwargs.get('strict', False)
+        self._allow_no_value = self._empty_lines_in_values
+        self._shared_defaults = False
+        self._shared_sections = set()
+        configparser.RawConfigParser.__init__(self, *args, **kwargs)
+
+    def _freeze(self, section):
+        return self._dict(
+            (sys.intern(k), _intern(v)) for k, v in section.items()
+        )
+
+    def read_shared(self, resultant):
+        """Load a resultant, parsing it only once per process.
+
+        The first parser reading a given resultant stores its sections, with
+        interned keys and values, in a bounded cache of the process. Every
+        parser reading the same resultant afterwards references these
+        sections instead of parsing the text again, and only copies a
+        section the first time it is modified, see _own_section.
+
+        :param resultant: ``str`` || ``file``
+        """
+        key = resultant_digest(resultant)
+        base = PARSED_INI_CACHE.get(key)
+        if base is None:
+            self.read_file(iter_lines(resultant))
+            base = (
+                self._freeze(self._defaults),
+                tuple(
+                    (sys.intern(name), self._freeze(section))
+                    for name, section in self._sections.items()
+                )
+            )
+            PARSED_INI_CACHE[key] = base
+            while len(PARSED_INI_CACHE) > PARSED_INI_CACHE_SIZE:
+                PARSED_INI_CACHE.popitem(last=False)
+        else:
+            PARSED_INI_CACHE.move_to_end(key)
+
+        defaults, sections = base
+        self._defaults = defaults
+        self._sections = self._dict(sections)
+        self._shared_defaults = True
+        self._shared_sections = set(self._sections)
+
+    def _own_section(self, section):
+        """Copy a shared section before it is modified."""
+        if not section or section in ('DEFAULT', self.default_section):
+            if self._shared_defaults:
+                self._defaults = self._dict(self._defaults)
+                self._shared_defaults = False
+        elif section in self._shared_sections:
+            self._sections[section] = self._dict(self._sections[section])
+            self._shared_sections.discard(section)
+
+    def remove_option(self, section, option):
+        self._own_section(section)
+        return configparser.RawConfigParser.remove_option(
+            self, section, option
+        )
+
+    def set(self, section, option, value=None):
+        self._own_section(section)
+        if not section or section == 'DEFAULT':
+            sectdict = self._defaults
+            use_defaults = True
+        else:
+            try:
+                sectdict = self._sections[section]
+            except KeyError:
+                raise SystemError('Section %s not found' % section)
+            else:
+                use_defaults = False
+
+        option = self.optionxform(option)
+        if use_defaults:
+            try:
+                index = sectdict.index('#%s' % option)
+            except (ValueError, IndexError):
+                sectdict[option] = value
+            else:
+                self._defaults = sectdict.insert(index, option, value)
+        else:
+            sectdict[option] = value
+
+    def _write(self, fp, section, key, item, entry):
+        if section:
+            # If we are not ignoring a none type value, then print out
+            # the option name only if the value type is None.
+            if not self.ignore_none_type and item is None:
+                fp.write(key + '\n')
+                return
+
+        fp.write(entry)
+
+    def _write_check(self, fp, key, value, section=False):
+        def _return_entry(option, item):
+            # If we have item, we consider it as a config parameter with value
+            if item is not None:
+                str_item = str(item).replace('\n', '\n\t')
+                return f"{option} = {str_item}\n"
+            elif not option:
+                return option
+            else:
+                return f"{option}\n"
+
+        key = key.split(STRIP_MARKER)[0]
+        if isinstance(value, (tuple, set)):
+            for i in sorted(value):
+                entry = _return_entry(option=key, item=i)
+                self._write(fp, section, key, i, entry)
+        elif isinstance(value, list):
+            _value = [str(i).replace('\n', '\n\t') for i in value]
+            entry = f"{key} = {','.join(_value)}\n"
+            self._write(fp, section, key, value, entry)
+        else:
+            entry = _return_entry(option=key, item=value)
+            self._write(fp, section, key, value, entry)
+
+    def write(self, fp, **kwargs):
+        def _do_write(section_name, section, section_bool=False):
+            fp.write(f"[{section_name}]\n")
+            for key, value in section.items():
+                self._write_check(
+                    fp,
+                    key=key,
+                    value=value,
+                    section=section_bool
+                )
+
+            fp.write("\n")
+
+        if self.default_section != 'DEFAULT':
+            if not self._sections.get(self.default_section, False):
+                _do_write(
+                    section_name=self.default_section,
+                    section=self._sections[self.default_section],
+                    section_bool=True
+                )
+        elif self._defaults:
+            _do_write('DEFAULT', self._defaults)
+
+        for i in self._sections:
+            _do_write(i, self._sections[i], section_bool=True)
+
+    def _read(self, fp, fpname):
+        optname = None
+        cursect = {}
+        marker_counter = 0
+        for lineno, line in enumerate(fp, start=0):
+            marker_counter += 1
+            mo_match = self.SECTCRE.match(line)
+            mo_optcre = self._optcre.match(line)
+            if mo_match:
+                sectname = mo_match.group('header')
+                if sectname in self._sections:
+                    cursect = self._sections[sectname]
+                elif sectname == 'DEFAULT':
+                    cursect = self._defaults
+                else:
+                    cursect = self._dict()
+                    self._sections[sectname] = cursect
+            elif mo_optcre:
+                optname, vi, optval = mo_optcre.group('option', 'vi', 'value')
+                optname = self.optionxform(optname.rstrip())
+                if optname and not optname.startswith('#') and optval:
+                    if vi in ('=', ':') and ';' in optval:
+                        pos = optval.find(';')
+                        if pos != -1 and optval[pos - 1].isspace():
+                            optval = optval[:pos]
+                    optval = optval.strip()
+                    if optval == '""':
+                        optval = ''
+                else:
+                    optname = '%s%s-%d' % (
+                        optname,
+                        STRIP_MARKER,
+                        marker_counter
+                    )
+                cursect[optname] = optval
+            else:
+                optname = '%s-%d' % (
+                    STRIP_MARKER,
+                    marker_counter
+                )
+                cursect[optname] = None
+
+
+class DictCompare(object):
+    """
+    Calculate the difference between two dictionaries.
+
+    Example Usage:
+    >>> base_dict = {'test1': 'val1', 'test2': 'val2', 'test3': 'val3'}
+    >>> new_dict = {'test1': 'val2', 'test3': 'val3', 'test4': 'val3'}
+    >>> dc = DictCompare(base_dict, new_dict)
+    >>> dc.added()
+    ... ['test4']
+    >>> dc.removed()
+    ... ['test2']
+    >>> dc.changed()
+    ... ['test1']
+    >>> dc.get_changes()
+    ... {'added':
+    ...     {'test4': 'val3'},
+    ...  'removed':
+    ...     {'test2': 'val2'},
+    ...  'changed':
+    ...     {'test1': {'current_val': 'vol1', 'new_val': 'val2'}
+    ... }
+    """
+
+    def __init__(self, base_dict, new_dict):
+        self.new_dict, self.base_dict = new_dict, base_dict
+        self.base_items, self.new_items = set(
+            self.base_dict.keys()), set(self.new_dict.keys())
+        self.intersect = self.new_items.intersection(self.base_items)
+
+    def added(self):
+        return self.new_items - self.intersect
+
+    def removed(self):
+        return self.base_items - self.intersect
+
+    def changed(self):
+        return set(
+            x for x in self.intersect if self.base_dict[x] != self.new_dict[x])
+
+    def get_changes(self):
+        """Returns dict of differences between 2 dicts and bool indicating if
+        there are differences
+
+        :param base_dict: ``dict``
+        :param new_dict: ``dict``
+        :returns: ``dict``, ``bool``
+        """
+        changed = False
+        mods = {'added': {}, 'removed': {}, 'changed': {}}
+
+        for s in self.changed():
+            changed = True
+            if type(self.base_dict[s]) is not dict:
+                mods['changed'] = {
+                    s: {'current_val': self.base_dict[s],
+                        'new_val': self.new_dict[s]}}
+                continue
+
+            diff = DictCompare(self.base_dict[s], self.new_dict[s])
+            for a in diff.added():
+                if s not in mods['added']:
+                    mods['added'][s] = {a: self.new_dict[s][a]}
+                else:
+                    mods['added'][s][a] = self.new_dict[s][a]
+
+            for r in diff.removed():
+                if s not in mods['removed']:
+                    mods['removed'][s] = {r: self.base_dict[s][r]}
+                else:
+                    mods['removed'][s][r] = self.base_dict[s][r]
+
+            for c in diff.changed():
+                if s not in mods['changed']:
+                    mods['changed'][s] = {
+                        c: {'current_val': self.base_dict[s][c],
+                            'new_val': self.new_dict[s][c]}}
+                else:
+                    mods['changed'][s][c] = {
+                        'current_val': self.base_dict[s][c],
+                        'new_val': self.new_dict[s][c]}
+
+        for s in self.added():
+            changed = True
+            mods['added'][s] = self.new_dict[s]
+
+        for s in self.removed():
+            changed = True
+            mods['removed'][s] = self.base_dict[s]
+
+        return mods, changed
+
+
+# Prefixes of the override keys selecting sections, or options, by pattern.
+GLOB_SELECTOR = 'glob:'
+REGEX_SELECTOR = 're:'
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_selector(key):
+    try:
+        if key.startswith(GLOB_SELECTOR):
+            return re.compile(fnmatch.translate(key[len(GLOB_SELECTOR):]))
+        return re.compile(key[len(REGEX_SELECTOR):])
+    except re.error as exp:
+        raise ConfigTemplateError(
+            'Invalid selector [ %s ]: %s' % (key, exp)
+        )
+
+
+def selector(key):
+    """Return the compiled pattern of a selector key, None for other keys.
+
+    Override keys starting with ``glob:`` or ``re:`` select every existing
+    section, or option, whose whole name matches the shell pattern or the
+    regular expression following the prefix. Patterns are compiled once.
+
+    :param key: ``str``
+    :returns: ``re.Pattern`` || ``None``
+    """
+    if isinstance(key, str) and key.startswith(
+            (GLOB_SELECTOR, REGEX_SELECTOR)):
+        return _compile_selector(str(key))
+    return None
+
+
+def expand_selectors(config_overrides, names):
+    """Return the overrides with their section selectors expanded.
+
+    Every selector is replaced by the sections of names it matches. The
+    selected sections come first, so overrides naming a section explicitly
+    take precedence over the selectors matching it.
+
+    :param config_overrides: ``dict``
+    :param names: ``list`` of section names
+    :returns: ``list`` of (section, items) tuples
+    """
+    selected = []
+    explicit = []
+    for key, items in config_overrides.items():
+        pattern = selector(key)
+        if pattern is not None and isinstance(items, dict):
+            selected.extend(
+                (name, items) for name in names if pattern.fullmatch(name)
+            )
+        else:
+            explicit.append((key, items))
+    return selected + explicit
+
+
+def _section_options(config, section):
+    """Return the names of the options set in a section."""
+    if section == 'DEFAULT':
+        items = config._defaults
+    else:
+        items = config._sections.get(section, {})
+    return [
+        k for k in items if STRIP_MARKER not in k and not k.startswith('#')
+    ]
+
+
+def _options_write(config, section, items):
+    """Write the options of a section, expanding the option selectors.
+
+    Options selected by a pattern are written before the ones named
+    explicitly, which take precedence.
+    """
+    explicit = []
+    for key, value in items.items():
+        pattern = selector(key)
+        if pattern is None:
+            explicit.append((key, value))
+            continue
+        for option in _section_options(config, section):
+            if pattern.fullmatch(option):
+                _option_write(config, section, option, value)
+    for key, value in explicit:
+        _option_write(config, section, key, value)
+
+
+def _option_write(config, section, key, value):
+    s_section = str(section)
+    s_key = str(key)
+    config.remove_option(s_section, s_key)
+    if isinstance(value, dict):
+        # If a dict is passed, check if it's effectively empty (no true values)
+        if not any(value.values()):
+            value = tuple(value.keys())
+
+    if isinstance(value, (tuple, set)):
+        config.set(s_section, s_key, value)
+    elif isinstance(value, list):
+        config.set(s_section, s_key, ','.join(map(str, value)))
+    else:
+        config.set(s_section, s_key, str(value))
+
+
+def merge_ini(config_overrides,
+              resultant,
+              list_extend=True,
+              ignore_none_type=True,
+              default_section='DEFAULT',
+              yml_multilines=False,
+              share_parsed_base=False):
+    """Returns string value from a modified config file and dict of
+    merged config
+
+    :param config_overrides: ``dict``
+    :param resultant: ``str`` || ``unicode`` || ``file``
+    :param share_parsed_base: ``bool``
+    :returns: ``str``, ``dict``
+    """
+    def _add_section(section_name):
+        # Attempt to add a section to the config file passing if
+        #  an error is raised that is related to the section
+        #  already existing.
+        try:
+            config.add_section(section_name)
+        except (configparser.DuplicateSectionError, ValueError):
+            pass
+
+    config = ConfigTemplateParser(
+        allow_no_value=True,
+        dict_type=MultiKeyDict,
+        ignore_none_type=ignore_none_type,
+        default_section=default_section,
+        yml_multilines=yml_multilines,
+        comment_prefixes='/'
+    )
+    config.optionxform = str
+
+    if share_parsed_base:
+        config.read_shared(resultant)
+    else:
+        config.read_file(iter_lines(resultant))
+
+    if default_section != 'DEFAULT':
+        _add_section(section_name=default_section)
+
+    overrides = expand_selectors(config_overrides, config.sections())
+    for section, items in overrides:
+        # If the items value is not a dictionary it is assumed that the
+        #  value is a default item for this config type.
+        if not isinstance(items, dict):
+            if isinstance(items, list):
+                items = ','.join(str(i) for i in items)
+
+            _options_write(
+                config,
+                default_section,
+                {section: items}
+            )
+        else:
+            _add_section(section_name=section)
+            try:
+                _options_write(config, section, items)
+            except configparser.NoSectionError as exp:
+                error_msg = str(exp)
+                error_msg += (
+                    ' Try being more explicit with your override'
+                    'data. Sections are case sensitive.'
+                )
+                raise ConfigTemplateError(error_msg)
+
+    config_dict_new = dict()
+    config_defaults = config.defaults()
+    for s in config.sections():
+        config_dict_new[s] = dict()
+        for k, v in config.items(s):
+            if k not in config_defaults or config_defaults[k] != v:
+                config_dict_new[s][k] = v
+            else:
+                if default_section in config_dict_new:
+                    config_dict_new[default_section][k] = v
+                else:
+                    config_dict_new[default_section] = {k: v}
+
+    resultant_stringio = StringIO()
+    try:
+        config.write(resultant_stringio)
+        return resultant_stringio.getvalue(), config_dict_new
+    finally:
+        resultant_stringio.close()
+
+
+def merge_json(config_overrides,
+               resultant,
+               list_extend=True,
+               ignore_none_type=True,
+               default_section='DEFAULT',
+               yml_multilines=False):
+    """Returns config json and dict of merged config
+
+    Its important to note that file ordering will not be preserved as the
+    information within the json file will be sorted by keys.
+
+    :param config_overrides: ``dict``
+    :param resultant: ``str`` || ``unicode`` || ``file``
+    :returns: ``str``, ``dict``
+    """
+    if isinstance(resultant, str):
+        original_resultant = json.loads(resultant)
+    else:
+        original_resultant = json.load(resultant)
+    merged_resultant = merge_dict(
+        base_items=original_resultant,
+        new_items=config_overrides,
+        list_extend=list_extend,
+        yml_multilines=yml_multilines
+    )
+    return json.dumps(
+        merged_resultant,
+        indent=4,
+        sort_keys=True
+    ), merged_resultant
+
+
+def merge_yaml(config_overrides,
+               resultant,
+               list_extend=True,
+               ignore_none_type=True,
+               default_section='DEFAULT',
+               yml_multilines=False,
+               dumper=IDumper):
+    """Return config yaml and dict of merged config
+
+    :param config_overrides: ``dict``
+    :param resultant: ``str`` || ``unicode`` || ``file``
+    :param dumper: ``yaml.Dumper``
+    :returns: ``str``, ``dict``
+    """
+    original_resultant = yaml.safe_load(resultant)
+    merged_resultant = merge_dict(
+        base_items=original_resultant,
+        new_items=config_overrides,
+        list_extend=list_extend,
+        yml_multilines=yml_multilines
+    )
+    return yaml.dump(
+        merged_resultant,
+        Dumper=dumper,
+        default_flow_style=False,
+        width=1000,
+    ), merged_resultant
+
+
+def merge_dict(base_items,
+               new_items,
+               list_extend=True,
+               yml_multilines=False):
+    """Recursively merge new_items into base_items.
+
+    :param base_items: ``dict``
+    :param new_items: ``dict`` || ``list``
+    :returns: ``dict``
+    """
+    if isinstance(new_items, dict):
+        for key, value in new_items.items():
+            if isinstance(value, dict):
+                base_items[key] = merge_dict(
+                    base_items=base_items.get(key, {}),
+                    new_items=value,
+                    list_extend=list_extend
+                )
+            elif (not isinstance(value, int) and (
+                  ',' in value or (
+                    '\n' in value and not yml_multilines))):
+                base_items[key] = re.split(',|\n', value)
+                base_items[key] = [
+                    i.strip() for i in base_items[key] if i
+                ]
+            elif isinstance(value, list):
+                if isinstance(base_items.get(key), list) and list_extend:
+                    base_items[key].extend(value)
+                else:
+                    base_items[key] = value
+            elif isinstance(value, (tuple, set)):
+                le = list_extend  # assigned for pep8
+                if isinstance(base_items.get(key), tuple) and le:
+                    base_items[key] += tuple(value)
+                elif isinstance(base_items.get(key), list) and le:
+                    base_items[key].extend(list(value))
+                else:
+                    base_items[key] = value
+            else:
+                base_items[key] = new_items[key]
+    elif isinstance(new_items, list):
+        if list_extend:
+            base_items.extend(new_items)
+        else:
+            base_items = new_items
+    return base_items
+
+
+CONFIG_TYPES = {
+    'ini': merge_ini,
+    'json': merge_json,
+    'yaml': merge_yaml
+}
+
+
+def merge(config_type, resultant, config_overrides, **kwargs):
+    """Merge overrides into a file with the merger of its config_type.
+
+    :param config_type: ``str``
+    :param resultant: ``str`` || ``file``
+    :param config_overrides: ``dict`` || ``list``
+    :returns: ``str``, ``dict``
+    """
+    try:
+        merger = CONFIG_TYPES[config_type]
+    except KeyError:
+        raise ConfigTemplateError(
+            'No valid [ config_type ] was provided. Valid options are %s.' % (
+                ', '.join(sorted(CONFIG_TYPES))
+            )
+        )
+    return merger(
+        config_overrides=config_overrides,
+        resultant=resultant,
+        **kwargs
+    )
+
+
+def iter_mapped_lines(path):
+    """Yield the lines of a file through a memory map of it.
+
+    Only the pages holding the current line need to be resident, whatever
+    the size of the file.
+
+    :param path: ``str``
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b''):
+                yield line.decode('utf-8', 'surrogateescape')
+
+
+def iter_stanzas(lines, stanza_key=None):
+    """Yield the name and the lines of every stanza of a file.
+
+    Without stanza_key the stanzas are the sections of an ini file, named
+    by their header, the lines before the first header have no name. With
+    stanza_key they are the RFC822 stanzas of a file like a debian Packages
+    index, separated by blank lines and named by the value of their
+    stanza_key field. The blank lines following a stanza belong to it.
+
+    :param lines: ``iterable``
+    :param stanza_key: ``str``
+    """
+    name = None
+    stanza = []
+    if stanza_key is None:
+        for line in lines:
+            match = ConfigTemplateParser.SECTCRE.match(line)
+            if match:
+                if stanza:
+                    yield name, stanza
+                name = match.group('header')
+                stanza = []
+            stanza.append(line)
+    else:
+        prefix = stanza_key.lower() + ':'
+        for line in lines:
+            if not line.strip():
+                stanza.append(line)
+                continue
+            if stanza and not stanza[-1].strip():
+                yield name, stanza
+                name = None
+                stanza = []
+            if name is None and line.lower().startswith(prefix):
+                name = line[len(prefix):].strip()
+            stanza.append(line)
+    if stanza:
+        yield name, stanza
+
+
+def _field_lines(field, value):
+    """Return the lines of an RFC822 field."""
+    if isinstance(value, (list, tuple, set)):
+        value = ', '.join(str(i) for i in value)
+    lines = str(value).split('\n')
+    return ['%s: %s\n' % (field, lines[0])] + [
+        ' %s\n' % (i if i.strip() else '.') for i in lines[1:]
+    ]
+
+
+def _merge_fields(stanza, overrides):
+    """Merge overrides into the fields of an RFC822 stanza.
+
+    Fields are matched regardless of their case, a None value removes a
+    field and new fields are added after the existing ones. Selector keys
+    only apply to the existing fields they match, the fields named
+    explicitly take precedence.
+
+    :param stanza: ``list`` of lines
+    :param overrides: ``dict``
+    :returns: ``list`` of lines
+    """
+    pending = collections.OrderedDict()
+    selectors = []
+    for key, value in overrides.items():
+        pattern = selector(key)
+        if pattern is None:
+            pending[str(key).lower()] = (str(key), value)
+        else:
+            selectors.append((pattern, value))
+
+    merged = []
+    trailer = []
+    skip = False
+    for line in stanza:
+        if not line.strip():
+            trailer.append(line)
+            continue
+        if line[0] in ' \t':
+            # Continuation of the previous field.
+            if not skip:
+                merged.append(line)
+            continue
+        field = line.split(':', 1)[0].strip()
+        skip = True
+        if field.lower() in pending:
+            value = pending.pop(field.lower())[1]
+        else:
+            matched = [v for p, v in selectors if p.fullmatch(field)]
+            if matched:
+                value = matched[-1]
+            else:
+                skip = False
+        if skip:
+            if value is not None:
+                merged.extend(_field_lines(field, value))
+        else:
+            merged.append(line)
+    if merged and not merged[-1].endswith('\n'):
+        merged[-1] += '\n'
+    for key, value in pending.values():
+        if value is not None:
+            merged.extend(_field_lines(key, value))
+    return merged + trailer
+
+
+def merge_stream(config_overrides,
+                 source,
+                 fp,
+                 stanza_key=None,
+                 ignore_none_type=True,
+                 default_section='DEFAULT'):
+    """Merge overrides into a stanza file one stanza at a time.
+
+    The source is memory mapped and read one stanza at a time, the merged
+    file is written to fp as it goes, so the memory used depends on the size
+    of the largest stanza rather than on the size of the file. Stanzas
+    without overrides are copied as they are. Sections of an ini file are
+    merged like merge_ini does, the fields of RFC822 stanzas are replaced.
+    Overridden stanzas missing from the source are added at the end.
+
+    :param config_overrides: ``dict`` of stanza names to ``dict``
+    :param source: ``str`` path of the file
+    :param fp: ``file`` opened for writing text
+    :param stanza_key: ``str`` field naming RFC822 stanzas, ini sections
+                       are used when it is not set
+    :param ignore_none_type: ``bool``
+    :param default_section: ``str``
+    :returns: ``dict`` of stanza counts
+    """
+    overrides = collections.OrderedDict()
+    for name, items in config_overrides.items():
+        if isinstance(items, dict):
+            overrides.setdefault(str(name), {}).update(items)
+        elif stanza_key is None:
+            overrides.setdefault(default_section, {})[name] = items
+        else:
+            raise ConfigTemplateError(
+                'The overrides of the stanza %s must be a dictionary' % name
+            )
+
+    selectors = []
+    for name in list(overrides):
+        pattern = selector(name)
+        if pattern is not None:
+            selectors.append((pattern, overrides.pop(name)))
+
+    def stanza_overrides(name):
+        # The stanzas named explicitly take precedence over the selectors,
+        # which never select the DEFAULT section, like merge_ini.
+        items = {}
+        for pattern, selected in selectors:
+            if pattern.fullmatch(name) and (
+                    stanza_key is not None or name != 'DEFAULT'):
+                items.update(selected)
+        items.update(overrides.get(name, {}))
+        return items
+
+    def rewrite(name, stanza, items):
+        if stanza_key is not None:
+            return _merge_fields(stanza, items)
+        # The blank lines after the section are kept as they are.
+        end = len(stanza)
+        while end and not stanza[end - 1].strip():
+            end -= 1
+        resultant, _ = merge_ini(
+            {name: items},
+            ''.join(stanza[:end]),
+            ignore_none_type=ignore_none_type
+        )
+        return [resultant.rstrip('\n') + '\n'] + stanza[end:]
+
+    counts = dict(stanzas=0, merged=0, added=0)
+    found = set()
+    last = '\n'
+    for name, stanza in iter_stanzas(iter_mapped_lines(source), stanza_key):
+        counts['stanzas'] += 1
+        items = stanza_overrides(name) if name is not None else None
+        if items:
+            found.add(name)
+            counts['merged'] += 1
+            stanza = rewrite(name, stanza, items)
+        for line in stanza:
+            fp.write(line)
+            last = line
+    for name in overrides:
+        if name in found:
+            continue
+        if not last.endswith('\n'):
+            fp.write('\n')
+        if last.strip():
+            fp.write('\n')
+        if stanza_key is not None:
+            stanza = ['%s: %s\n' % (stanza_key, name)]
+        else:
+            stanza = ['[%s]\n' % name]
+        stanza = rewrite(name, stanza, overrides[name])
+        for line in stanza:
+            fp.write(line)
+            last = line
+        counts['added'] += 1
+    return counts
+
+
+def ini_as_dict(resultant_dict, return_dict=None):
+    """Return a merged ini config without the markers of its comments.
+
+    :param resultant_dict: ``dict``
+    :param return_dict: ``dict``
+    :returns: ``dict``
+    """
+    if not return_dict:
+        return_dict = {}
+
+    for key, value in resultant_dict.items():
+        if not value:
+            continue
+        key = key.split(STRIP_MARKER)[0]
+        if isinstance(value, (dict, MultiKeyDict)):
+            return_dict[key] = ini_as_dict(value)
+        else:
+            return_dict[key] = value
+
+    return return_dict
+
+
+def diff(config_new, config_base):
+    """Return the changes between two merged configs.
+
+    :param config_new: ``dict`` || ``list`` || ``None``
+    :param config_base: ``dict`` || ``list``
+    :returns: ``dict``, ``bool``
+    """
+    if isinstance(config_base, dict):
+        if not config_new:
+            config_new = dict()
+        cmp_dicts = DictCompare(
+            ini_as_dict(resultant_dict=config_new),
+            ini_as_dict(resultant_dict=config_base)
+        )
+        return cmp_dicts.get_changes()
+    elif isinstance(config_base, list):
+        if not config_new:
+            config_new = list()
+        mods = {
+            'added': [
+                i for i in config_new
+                if i not in config_base
+            ],
+            'removed': [
+                i for i in config_base
+                if i not in config_new
+            ],
+            'changed': [
+                i for i in (config_base + config_new)
+                if i not in config_base or i not in config_new
+            ]
+        }
+        return mods, len(mods['changed']) > 0
+    return {'added': {}, 'removed': {}, 'changed': {}}, False
+
+
+def _combine_overrides(base, new):
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _combine_overrides(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_overrides(paths):
+    """Load and combine override files, later files taking precedence.
+
+    The files are yaml, or json which yaml is a superset of.
+
+    :param paths: ``list``
+    :returns: ``dict`` || ``list``
+    """
+    overrides = {}
+    for path in paths:
+        with open(path) as f:
+            data = yaml.safe_load(f)
+        if data is None:
+            continue
+        elif isinstance(data, dict) and isinstance(overrides, dict):
+            overrides = _combine_overrides(overrides, data)
+        else:
+            overrides = data
+    return overrides
+
+
+def main(argv=None):
+    """Entry point of the config-template command.
+
+    :param argv: ``list``
+    :returns: ``int``
+    """
+    parser = argparse.ArgumentParser(
+        prog='config-template',
+        description='Merge overrides into an ini, json or yaml file.'
+    )
+    parser.add_argument(
+        'base',
+        help='File to merge the overrides into, - to read standard input'
+    )
+    parser.add_argument(
+        '-t', '--config-type',
+        required=True,
+        choices=sorted(CONFIG_TYPES)
+    )
+    parser.add_argument(
+        '-o', '--overrides',
+        action='append',
+        default=[],
+        help='Yaml or json file of overrides, can be repeated'
+    )
+    parser.add_argument(
+        '-d', '--dest',
+        help='File to write the merged output to, standard output otherwise'
+    )
+    parser.add_argument(
+        '--diff',
+        action='store_true',
+        help='Print the changes to the existing dest on standard error'
+    )
+    parser.add_argument('--no-list-extend', action='store_true')
+    parser.add_argument('--no-ignore-none-type', action='store_true')
+    parser.add_argument('--default-section', default='DEFAULT')
+    parser.add_argument('--yml-multilines', action='store_true')
+    args = parser.parse_args(argv)
+
+    options = dict(
+        list_extend=not args.no_list_extend,
+        ignore_none_type=not args.no_ignore_none_type,
+        default_section=args.default_section,
+        yml_multilines=args.yml_multilines
+    )
+    try:
+        if args.base == '-':
+            resultant = sys.stdin.read()
+        else:
+            with open(args.base) as f:
+                resultant = f.read()
+        merged, config_base = merge(
+            args.config_type,
+            resultant,
+            load_overrides(args.overrides),
+            **options
+        )
+
+        if args.diff:
+            config_new = None
+            if args.dest and os.path.exists(args.dest):
+                with open(args.dest) as f:
+                    _, config_new = merge(
+                        args.config_type, f.read(), {}, **options
+                    )
+            mods, _ = diff(config_new, config_base)
+            json.dump(
+                mods,
+                sys.stderr,
+                indent=4,
+                sort_keys=True,
+                default=lambda i: sorted(str(j) for j in i)
+            )
+            sys.stderr.write('\n')
+    except (ConfigTemplateError, OSError, ValueError, yaml.YAMLError,
+            configparser.Error) as exp:
+        sys.stderr.write('config-template: %s\n' % exp)
+        return 1
+
+    if args.dest:
+        with open(args.dest, 'w') as f:
+            f.write(merged)
+    else:
+        sys.stdout.write(merged)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Report what config_template would change on a whole inventory.
+
+The files of a specs file (see bulk_render) are rendered and merged on the
+controller by a pool of processes. The current destinations are then
+fetched concurrently with asyncio, at most ``concurrency`` at a time, and
+compared to the merged output the way the diff mode of the action plugin
+does.
+
+Destinations are read over ssh with ``cat``, using the ``ansible_host``,
+``ansible_port`` and ``ansible_user`` of every host. A local directory laid
+out like the output of bulk_render, ``<dir>/<inventory_hostname>/<dest>``,
+can stand in for the hosts, to compare two rendered trees or to test.
+"""
+
+import argparse
+import asyncio
+import errno
+import json
+import shlex
+import sys
+import tempfile
+import time
+
+from ansible.inventory.manager import InventoryManager
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+from ansible.vars.manager import VariableManager
+
+try:
+    from ansible_collections.openstack.config_template.plugins.plugin_utils \
+        import bulk_render
+    from ansible_collections.openstack.config_template.plugins.plugin_utils \
+        import config_merge
+except ImportError:
+    import bulk_render
+    import config_merge
+
+
+SSH_COMMAND = ('ssh', '-o', 'BatchMode=yes')
+SSH_TIMEOUT = 30
+CONCURRENCY = 16
+
+
+class FetchError(Exception):
+    pass
+
+
+def ssh_targets(inventory, hosts):
+    """Return the ssh connection settings of hosts.
+
+    :param inventory: ``list`` of inventory sources
+    :param hosts: ``list`` of host names
+    :returns: ``dict`` of host name to (address, port, user)
+    """
+    bulk_render._init_plugin_loader()
+    loader = DataLoader()
+    inventory_manager = InventoryManager(loader=loader, sources=inventory)
+    variable_manager = VariableManager(
+        loader=loader, inventory=inventory_manager
+    )
+    targets = {}
+    for name in hosts:
+        host = inventory_manager.get_host(name)
+        host_vars = variable_manager.get_vars(host=host)
+        templar = Templar(loader=loader, variables=host_vars)
+        settings = []
+        for key, default in (('ansible_host', name), ('ansible_port', None),
+                             ('ansible_user', None)):
+            value = host_vars.get(key, default)
+            if value is not None:
+                value = str(templar.template(value))
+            settings.append(value)
+        targets[name] = tuple(settings)
+    return targets
+
+
+async def fetch_local(root, host, dest):
+    """Read the destination of a host from a local tree.
+
+    :param root: ``str``
+    :param host: ``str``
+    :param dest: ``str``
+    :returns: ``str`` or ``None`` when the destination does not exist
+    """
+    try:
+        path = bulk_render.host_path(root, host, dest)
+    except ValueError as exp:
+        raise FetchError(str(exp))
+
+    def read():
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError as exp:
+            if exp.errno == errno.ENOENT:
+                return None
+            raise FetchError(str(exp))
+
+    return await asyncio.get_running_loop().run_in_executor(None, read)
+
+
+async def fetch_ssh(target, dest, ssh_options=(), sudo=False,
+                    timeout=SSH_TIMEOUT):
+    """Read the destination of a host over ssh.
+
+    :param target: ``tuple`` of the address, port and user
+    :param dest: ``str``
+    :param ssh_options: ``list`` of extra ssh arguments
+    :param sudo: ``bool``
+    :param timeout: ``int``
+    :returns: ``str`` or ``None`` when the destination does not exist
+    """
+    address, port, user = target
+    command = list(SSH_COMMAND) + list(ssh_options)
+    if port:
+        command.extend(['-p', port])
+    if user:
+        command.extend(['-l', user])
+    # Exit 3 tells a missing file from a failed read.
+    remote = 'test -e {0} || exit 3; cat -- {0}'.format(shlex.quote(dest))
+    if sudo:
+        remote = 'sudo -n sh -c %s' % shlex.quote(remote)
+    command.extend([address, remote])
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(), timeout
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise FetchError('Timed out after %ss' % timeout)
+    if process.returncode == 3:
+        return None
+    elif process.returncode != 0:
+        raise FetchError(
+            stderr.decode('utf-8', 'replace').strip() or
+            'ssh exited with %s' % process.returncode
+        )
+    return stdout.decode('utf-8')
+
+
+async def fetch_all(jobs, fetch, concurrency=CONCURRENCY):
+    """Fetch destinations concurrently, in the order of the jobs.
+
+    :param jobs: ``list`` of (host, dest) tuples
+    :param fetch: ``callable`` coroutine function taking a host and a dest
+    :param concurrency: ``int``
+    :returns: ``list`` of (content, error) tuples
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(host, dest):
+        async with semaphore:
+            try:
+                return await fetch(host, dest), None
+            except (FetchError, OSError, UnicodeDecodeError) as exp:
+                return None, str(exp)
+
+    return await asyncio.gather(*[run(host, dest) for host, dest in jobs])
+
+
+def diff_file(rendered, current, options):
+    """Compare a merged file with the current content of its destination.
+
+    Both sides are parsed by the merger of the config type, as the diff
+    mode of the action plugin does.
+
+    :param rendered: ``dict`` result of bulk_render
+    :param current: ``str`` or ``None``
+    :param options: ``dict`` merge options
+    :returns: ``dict``, ``bool``
+    """
+    with open(rendered['path']) as f:
+        _, config_base = config_merge.merge(
+            rendered['config_type'], f.read(), {}, **options
+        )
+    config_new = None
+    if current is not None:
+        _, config_new = config_merge.merge(
+            rendered['config_type'], current, {}, **options
+        )
+    mods, changed = config_merge.diff(config_new, config_base)
+    return mods, changed or current is None
+
+
+def report(inventory, specs_path, fetch_dir=None, concurrency=CONCURRENCY,
+           workers=None, limit=None, output=None, ssh_options=(),
+           sudo=False, timeout=SSH_TIMEOUT):
+    """Return the changes config_template would make to an inventory.
+
+    :param inventory: ``list`` of inventory sources
+    :param specs_path: ``str``
+    :param fetch_dir: ``str`` local tree standing in for the hosts
+    :param concurrency: ``int`` destinations fetched at once
+    :param workers: ``int`` rendering processes
+    :param limit: ``str`` inventory pattern
+    :param output: ``str`` directory the merged files are kept in
+    :param ssh_options: ``list``
+    :param sudo: ``bool``
+    :param timeout: ``int``
+    :returns: ``list``
+    """
+    with tempfile.TemporaryDirectory(
+            prefix='config_template-diff-') as tmp_dir:
+        results = bulk_render.render_inventory(
+            inventory,
+            specs_path,
+            output or tmp_dir,
+            workers=workers,
+            limit=limit
+        )
+        rendered = [i for i in results if 'error' not in i]
+        jobs = [(i['host'], i['dest']) for i in rendered]
+
+        if fetch_dir:
+            async def fetch(host, dest):
+                return await fetch_local(fetch_dir, host, dest)
+        else:
+            targets = ssh_targets(inventory, sorted(set(i[0] for i in jobs)))
+
+            async def fetch(host, dest):
+                return await fetch_ssh(
+                    targets[host], dest, ssh_options, sudo, timeout
+                )
+
+        fetched = asyncio.run(fetch_all(jobs, fetch, concurrency))
+
+        loader = DataLoader()
+        specs = bulk_render.load_specs(loader, specs_path)
+        for result, (current, error) in zip(rendered, fetched):
+            if error:
+                result['error'] = 'Can not fetch the destination: %s' % error
+                continue
+            try:
+                mods, result['changed'] = diff_file(
+                    result,
+                    current,
+                    bulk_render.merge_options(specs[result['spec']])
+                )
+            except Exception as exp:
+                result['error'] = '%s: %s' % (type(exp).__name__, exp)
+                continue
+            result['exists'] = current is not None
+            if result['changed']:
+                result['diff'] = mods
+            if not output:
+                del result['path']
+    return results
+
+
+def main(argv=None):
+    """Entry point of the config-template-diff command.
+
+    :param argv: ``list``
+    :returns: ``int``
+    """
+    parser = argparse.ArgumentParser(
+        prog='config-template-diff',
+        description='Report the changes config_template would make.'
+    )
+    parser.add_argument('specs', help='Yaml file of the files to render')
+    parser.add_argument(
+        '-i', '--inventory',
+        action='append',
+        required=True,
+        help='Inventory source, can be repeated'
+    )
+    parser.add_argument(
+        '-f', '--fetch-dir',
+        help='Read the destinations from <dir>/<host>/<dest> instead of ssh'
+    )
+    parser.add_argument(
+        '-c', '--concurrency',
+        type=int,
+        default=CONCURRENCY,
+        help='Number of destinations fetched at once'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of rendering processes, the number of cores by default'
+    )
+    parser.add_argument('-l', '--limit', help='Limit to an inventory pattern')
+    parser.add_argument(
+        '-o', '--output',
+        help='Keep the merged files in this directory'
+    )
+    parser.add_argument(
+        '--ssh-option',
+        action='append',
+        default=[],
+        help='Extra argument of ssh, can be repeated'
+    )
+    parser.add_argument(
+        '--sudo',
+        action='store_true',
+        help='Read the destinations with sudo'
+    )
+    parser.add_argument('--timeout', type=int, default=SSH_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    results = report(
+        args.inventory,
+        args.specs,
+        fetch_dir=args.fetch_dir,
+        concurrency=args.concurrency,
+        workers=args.workers,
+        limit=args.limit,
+        output=args.output,
+        ssh_options=args.ssh_option,
+        sudo=args.sudo,
+        timeout=args.timeout
+    )
+    failed = [i for i in results if 'error' in i]
+    json.dump(
+        dict(
+            files=len(results),
+            changed=len([i for i in results if i.get('changed')]),
+            failed=len(failed),
+            elapsed=round(time.monotonic() - start, 3),
+            results=results
+        ),
+        sys.stdout,
+        indent=4,
+        sort_keys=True,
+        default=lambda i: sorted(str(j) for j in i)
+    )
+    sys.stdout.write('\n')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Controller side state shared by the tasks of a run.
+
+The state lives in the local temporary directory of the running ansible
+process, which is shared by all of the forks and removed when the run ends,
+so it is never carried over to a later run the way cached facts are. It is
+kept per connection target, the host, port and user a task actually
+connects with, which is the delegated host of a delegated task rather than
+its inventory host.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from ansible import constants as C
+from ansible.module_utils._text import to_bytes
+
+
+# Run state of the destinations recorded by config_template_stat.
+DEST_STAT_STATE = 'dest-stat'
+
+
+def remote_user(action, task_vars):
+    """Return the user an action plugin connects with.
+
+    :param action: ``ActionBase``
+    :param task_vars: ``dict``
+    :returns: ``str`` || ``None``
+    """
+    try:
+        return action._get_remote_user()
+    except Exception:
+        user = task_vars.get('ansible_user')
+        if not user:
+            user = task_vars.get('ansible_ssh_user')
+        if not user:
+            user = action._play_context.remote_user
+        return user
+
+
+def connection_target(action, task_vars, user=None):
+    """Return the host, port and user an action plugin connects to.
+
+    The address is read from the options of the connection, which are set
+    from the delegated variables of a delegated task, and from those
+    variables when the connection has no such option.
+
+    :param action: ``ActionBase``
+    :param task_vars: ``dict``
+    :param user: ``str`` remote user, looked up when it is not given
+    :returns: ``str``
+    """
+    try:
+        address = action._get_remote_addr(task_vars)
+    except Exception:
+        address = None
+    if not address:
+        delegated_vars = task_vars.get('ansible_delegated_vars') or {}
+        delegated = delegated_vars.get(action._task.delegate_to) or {}
+        address = (
+            delegated.get('ansible_host') or
+            action._task.delegate_to or
+            task_vars.get('ansible_host') or
+            task_vars.get('inventory_hostname')
+        )
+    try:
+        port = action._connection.get_option('port')
+    except Exception:
+        port = getattr(action._play_context, 'port', None)
+    if user is None:
+        user = remote_user(action, task_vars)
+    return '%s@%s:%s' % (user, address, port or '')
+
+
+def state_path(name, target):
+    """Return the path of a state file of a connection target.
+
+    :param name: ``str`` kind of state
+    :param target: ``str`` see connection_target
+    :returns: ``str``
+    """
+    return os.path.join(
+        C.DEFAULT_LOCAL_TMP,
+        'config_template-%s-%s' % (
+            name, hashlib.sha1(to_bytes(target)).hexdigest()
+        )
+    )
+
+
+def load_state(path):
+    """Return the JSON state stored at path, empty when there is none.
+
+    :param path: ``str``
+    :returns: ``dict``
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    """Atomically store a JSON state at path.
+
+    :param path: ``str``
+    :param state: ``dict``
+    """
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
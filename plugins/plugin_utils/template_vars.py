@@ -0,0 +1,107 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The template_* and ansible_managed variables of a template.
+
+These are the variables the template module defines while rendering a
+source, shared by the action plugin and bulk_render so a template renders
+the same way with both.
+"""
+
+import collections
+import datetime
+import functools
+import os
+import pwd
+import time
+
+from ansible import constants as C
+from ansible.module_utils._text import to_bytes
+
+
+# Template metadata cache, see template_metadata.
+TEMPLATE_METADATA_CACHE = collections.OrderedDict()
+TEMPLATE_METADATA_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=None)
+def uid_name(uid):
+    """Return the user name of a uid, or the uid when it has no name.
+
+    :param uid: ``int``
+    :returns: ``str`` || ``int``
+    """
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except Exception:
+        return uid
+
+
+def build_template_metadata(source, mtime, template_uid, template_host):
+    """Return the template_* variables of a template and ansible_managed.
+
+    :param source: ``str``
+    :param mtime: ``float``
+    :param template_uid: ``str`` || ``int``
+    :param template_host: ``str``
+    :returns: ``dict``
+    """
+    managed_default = C.DEFAULT_MANAGED_STR
+    managed_str = managed_default.format(
+        host=template_host,
+        uid=template_uid,
+        file=to_bytes(source)
+    )
+    return {
+        'template_mtime': datetime.datetime.fromtimestamp(mtime),
+        'template_uid': template_uid,
+        'ansible_managed': time.strftime(
+            managed_str,
+            time.localtime(mtime)
+        ),
+        'template_fullpath': os.path.abspath(source)
+    }
+
+
+def template_metadata(source, template_host):
+    """Return the template_* variables of a controller side template.
+
+    The source template is the same for every host of a play, so the
+    variables are cached by path and revalidated with a single stat call
+    against the inode and modification time of the file. The cache lives in
+    the process, so it is shared by all of the items of a loop and all of
+    the hosts rendered by a worker.
+
+    :param source: ``str``
+    :param template_host: ``str``
+    :returns: ``dict``
+    """
+    st = os.stat(source)
+    key = os.path.abspath(source)
+    validator = (st.st_dev, st.st_ino, st.st_mtime_ns, template_host)
+    cached = TEMPLATE_METADATA_CACHE.get(key)
+    if cached and cached[0] == validator:
+        TEMPLATE_METADATA_CACHE.move_to_end(key)
+        return cached[1]
+
+    metadata = build_template_metadata(
+        source=source,
+        mtime=st.st_mtime,
+        template_uid=uid_name(st.st_uid),
+        template_host=template_host
+    )
+    TEMPLATE_METADATA_CACHE[key] = (validator, metadata)
+    if len(TEMPLATE_METADATA_CACHE) > TEMPLATE_METADATA_CACHE_SIZE:
+        TEMPLATE_METADATA_CACHE.popitem(last=False)
+    return metadata
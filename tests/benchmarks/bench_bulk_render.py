@@ -0,0 +1,143 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput of the bulk renderer with a growing number of workers.
+
+A synthetic inventory of ``--hosts`` hosts gets an ini, a json and a yaml
+file each, rendered with 1 worker up to ``--workers``, the number of cores
+by default. The files per second of every run are reported along with the
+speedup over a single worker.
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+import common
+
+
+INI = '''[DEFAULT]
+host = {{ inventory_hostname }}
+index = {{ index }}
+{% for i in range(64) %}
+[section{{ i }}]
+{% for j in range(16) %}
+option{{ j }} = {{ inventory_hostname }}-{{ i }}-{{ j }}
+{% endfor %}
+{% endfor %}
+'''
+
+JSON = '''{"host": "{{ inventory_hostname }}",
+ "items": {{ range(256) | list | to_json }}}
+'''
+
+YAML = '''host: {{ inventory_hostname }}
+nodes:
+{% for i in range(256) %}
+  node{{ i }}:
+    index: {{ i }}
+    host: {{ inventory_hostname }}
+{% endfor %}
+'''
+
+
+def setup(path, hosts):
+    """Write the inventory, the templates and the specs of the benchmark.
+
+    :param path: ``str``
+    :param hosts: ``int``
+    :returns: ``tuple`` of the inventory and the specs paths
+    """
+    inventory = os.path.join(path, 'inventory.ini')
+    with open(inventory, 'w') as f:
+        f.write('[all]\n')
+        for index in range(hosts):
+            f.write('host%05d index=%d\n' % (index, index))
+
+    specs = []
+    for config_type, template in (('ini', INI), ('json', JSON),
+                                  ('yaml', YAML)):
+        name = 'bench.%s.j2' % config_type
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(template)
+        specs.append(
+            dict(
+                src=name,
+                dest='/etc/bench/bench.%s' % config_type,
+                config_type=config_type,
+                config_overrides={
+                    'ini': {'section0': {'index': '{{ index }}'}},
+                    'json': {'index': '{{ index }}'},
+                    'yaml': {'nodes': {'node0': {'index': '{{ index }}'}}}
+                }[config_type]
+            )
+        )
+    specs_path = os.path.join(path, 'specs.yml')
+    with open(specs_path, 'w') as f:
+        yaml.safe_dump(specs, f, default_flow_style=False)
+    return inventory, specs_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help='Also write the results to a file')
+    args = parser.parse_args()
+
+    common.install_collection()
+    bulk_render = importlib.import_module(
+        common.COLLECTION + '.plugins.plugin_utils.bulk_render'
+    )
+
+    path = tempfile.mkdtemp(prefix='config_template-bulk-render-')
+    try:
+        inventory, specs = setup(path, args.hosts)
+        results = []
+        for workers in range(1, args.workers + 1):
+            output = os.path.join(path, 'output-%d' % workers)
+            start = time.perf_counter()
+            rendered = bulk_render.render_inventory(
+                [inventory], specs, output, workers=workers
+            )
+            elapsed = time.perf_counter() - start
+            failed = [i for i in rendered if 'error' in i]
+            if failed:
+                raise SystemExit(failed[0]['error'])
+            results.append(
+                dict(
+                    name='workers_%d' % workers,
+                    workers=workers,
+                    files=len(rendered),
+                    elapsed_s=round(elapsed, 3),
+                    files_per_s=round(len(rendered) / elapsed, 1)
+                )
+            )
+        for result in results:
+            result['speedup'] = round(
+                result['files_per_s'] / results[0]['files_per_s'], 2
+            )
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    common.emit('bulk_render', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
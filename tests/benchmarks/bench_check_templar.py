@@ -0,0 +1,120 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per call overhead of _check_templar.
+
+The templar is replaced by a stub returning the template untouched, so the
+numbers only account for the work done around the rendering: the version
+checks and the dispatch on the templar API, which used to happen on every
+call and are now resolved when the plugin is imported.
+"""
+
+import argparse
+
+import common
+
+
+class StubTemplar(object):
+    def copy_with_new_env(self, **kwargs):
+        return self
+
+    def template(self, data, **kwargs):
+        return data
+
+
+class StubTask(object):
+    args = {}
+
+
+def legacy_check_templar(plugin, action, data, extra):
+    """_check_templar as it was before the version gates moved to import."""
+    LooseVersion = plugin.LooseVersion
+    if plugin.boolean(action._task.args.get('render_template', True)):
+        templar = action._templar
+        t_vars = {
+            'searchpath': extra['searchpath']
+        }
+        overrides = {
+            k: extra[k] for k in [
+                'variable_start_string', 'variable_end_string',
+                'block_start_string', 'block_end_string'
+            ] if extra.get(k)
+        }
+        template_kwargs = dict(
+            preserve_trailing_newlines=True,
+            escape_backslashes=False,
+            overrides=overrides
+        )
+
+        if LooseVersion(plugin.__ansible_version__) >= LooseVersion('2.19'):
+            data = plugin.trust_as_template(data)
+
+        if LooseVersion(plugin.__ansible_version__) < LooseVersion('2.17'):
+            template_kwargs['convert_data'] = False
+
+        if hasattr(templar, 'copy_with_new_env'):
+            templar = templar.copy_with_new_env(**t_vars)
+            with plugin._compiled_template_cache():
+                return templar.template(data, **template_kwargs)
+        else:
+            with templar.set_temporary_context(**t_vars):
+                with plugin._compiled_template_cache():
+                    return templar.template(data, **template_kwargs)
+    else:
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    plugin = common.load_plugin()
+    action = plugin.ActionModule.__new__(plugin.ActionModule)
+    action._task = StubTask()
+    action._templar = StubTemplar()
+    data = 'key = {{ value }}\n'
+    extra = {'searchpath': ['/tmp']}
+
+    before = common.timeit(
+        lambda: legacy_check_templar(plugin, action, data, extra),
+        args.calls,
+        args.repeat
+    )
+    after = common.timeit(
+        lambda: action._check_templar(data, extra),
+        args.calls,
+        args.repeat
+    )
+    common.emit(
+        'check_templar',
+        [
+            {
+                'name': 'per_call_overhead',
+                'calls': args.calls,
+                'render_function': plugin._render_template.__name__,
+                'before_us': round(before, 3),
+                'after_us': round(after, 3),
+                'removed_us': round(before - after, 3),
+                'removed_total_ms': round(
+                    (before - after) * args.calls / 1000, 3
+                )
+            }
+        ]
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import time of the config_template action plugin.
+
+Every sample runs in a fresh interpreter which first imports the action
+plugin base of ansible, as ansible does before loading any action plugin,
+then times the execution of the config_template module alone, as with a
+warm bytecode cache. The compilation of the source is reported separately.
+The modules the plugin pulled in on top of ansible are reported along with
+the timings.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+import common
+
+
+SAMPLE = '''
+import json, sys, time, types
+sys.path.insert(0, %(benchmarks)r)
+import ansible.plugins.action
+import common
+common.install_collection()
+with open(%(plugin)r) as f:
+    source = f.read()
+start = time.perf_counter()
+code = compile(source, %(plugin)r, 'exec')
+compiled = time.perf_counter() - start
+module = types.ModuleType('config_template_action')
+module.__file__ = %(plugin)r
+sys.modules[module.__name__] = module
+before = set(sys.modules)
+start = time.perf_counter()
+exec(code, module.__dict__)
+elapsed = time.perf_counter() - start
+new = sorted(set(sys.modules) - before)
+print(json.dumps({'compile': compiled, 'elapsed': elapsed, 'modules': new}))
+'''
+
+
+def sample(python, plugin):
+    output = subprocess.check_output(
+        [
+            python, '-c',
+            SAMPLE % {'benchmarks': common.BENCHMARKS_DIR, 'plugin': plugin}
+        ]
+    )
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--python', default=sys.executable)
+    parser.add_argument(
+        '--plugin',
+        default=common.ACTION_PLUGIN,
+        help='Path of the action plugin, to compare with another version'
+    )
+    args = parser.parse_args()
+
+    samples = [sample(args.python, args.plugin) for _ in range(args.samples)]
+    timings = [i['elapsed'] * 1000 for i in samples]
+    compile_timings = [i['compile'] * 1000 for i in samples]
+    common.emit(
+        'import',
+        [
+            {
+                'name': 'plugin_import',
+                'samples': args.samples,
+                'median_ms': round(statistics.median(timings), 3),
+                'min_ms': round(min(timings), 3),
+                'max_ms': round(max(timings), 3),
+                'compile_median_ms': round(
+                    statistics.median(compile_timings), 3
+                ),
+                'imported_modules': samples[-1]['modules']
+            }
+        ]
+    )
+
+
+if __name__ == '__main__':
+    main()
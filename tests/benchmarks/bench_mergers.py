@@ -0,0 +1,174 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timings of the config_template mergers.
+
+The ini, json and yaml mergers, merge_dict, DictCompare and
+ConfigTemplateParser of the merge library are driven directly with the
+synthetic files of fixtures.py. Save the results of a commit with
+``--output`` and pass them to ``--compare`` on another one to get the ratio
+of the timings.
+"""
+
+import argparse
+import copy
+import json
+import re
+from io import StringIO
+
+import yaml
+
+import common
+import fixtures
+
+
+def benchmarks(library, scale):
+    """Return the name, size in bytes, setup and function of every benchmark.
+
+    :param library: ``module``
+    :param scale: ``float``
+    :returns: ``list``
+    """
+
+    ini = fixtures.ini_text(scale)
+    ini_overrides = fixtures.ini_overrides(scale)
+    ini_selectors, ini_enumerated = fixtures.ini_selector_overrides(scale)
+    multistropt = fixtures.multistropt_text(scale)
+    multistropt_overrides = fixtures.multistropt_overrides(scale)
+    tree = fixtures.yaml_tree(scale)
+    yaml_text = yaml.safe_dump(tree, default_flow_style=False)
+    yaml_overrides = fixtures.yaml_overrides(scale)
+    json_text = fixtures.json_text(scale)
+    json_overrides = fixtures.json_overrides(scale)
+
+    def parser():
+        config = library.ConfigTemplateParser(
+            allow_no_value=True,
+            dict_type=library.MultiKeyDict,
+            comment_prefixes='/'
+        )
+        config.optionxform = str
+        return config
+
+    def parsed_ini():
+        config = parser()
+        config.read_string(ini)
+        return config
+
+    _, ini_base = library.merge_ini({}, ini)
+    _, ini_merged = library.merge_ini(ini_overrides, ini)
+    ini_base = library.ini_as_dict(ini_base)
+    ini_merged = library.ini_as_dict(ini_merged)
+
+    return [
+        (
+            'ini_merge',
+            dict(bytes=len(ini), lines=ini.count('\n')),
+            None,
+            lambda: library.merge_ini(ini_overrides, ini)
+        ),
+        (
+            'ini_merge_selectors',
+            dict(bytes=len(ini), lines=ini.count('\n')),
+            None,
+            lambda: library.merge_ini(ini_selectors, ini)
+        ),
+        (
+            'ini_merge_enumerated',
+            dict(bytes=len(ini), lines=ini.count('\n')),
+            None,
+            lambda: library.merge_ini(ini_enumerated, ini)
+        ),
+        (
+            'ini_merge_multistropt',
+            dict(bytes=len(multistropt), lines=multistropt.count('\n')),
+            None,
+            lambda: library.merge_ini(multistropt_overrides, multistropt)
+        ),
+        (
+            'ini_parse',
+            dict(bytes=len(ini), lines=ini.count('\n')),
+            None,
+            parsed_ini
+        ),
+        (
+            'ini_write',
+            dict(bytes=len(ini), lines=ini.count('\n')),
+            parsed_ini,
+            lambda config: config.write(StringIO())
+        ),
+        (
+            'json_merge',
+            dict(bytes=len(json_text)),
+            None,
+            lambda: library.merge_json(json_overrides, json_text)
+        ),
+        (
+            'yaml_merge',
+            dict(bytes=len(yaml_text), nodes=fixtures.count_nodes(tree)),
+            None,
+            lambda: library.merge_yaml(yaml_overrides, yaml_text)
+        ),
+        (
+            'merge_dict',
+            dict(nodes=fixtures.count_nodes(tree)),
+            lambda: copy.deepcopy(tree),
+            lambda base: library.merge_dict(base, yaml_overrides)
+        ),
+        (
+            'dict_compare',
+            dict(sections=len(ini_merged)),
+            None,
+            lambda: library.DictCompare(ini_base, ini_merged).get_changes()
+        )
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help='Multiply the size of the synthetic files'
+    )
+    parser.add_argument(
+        '--filter',
+        help='Only run the benchmarks whose name matches this expression'
+    )
+    parser.add_argument('--output', help='Write the results to this file')
+    parser.add_argument(
+        '--compare',
+        help='Results of a previous run to compare the timings with'
+    )
+    args = parser.parse_args()
+
+    library = common.load_library()
+    results = []
+    for name, sizes, setup, func in benchmarks(library, args.scale):
+        if args.filter and not re.search(args.filter, name):
+            continue
+        result = dict(name=name, **sizes)
+        result.update(common.measure(func, args.repeat, setup))
+        results.append(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            common.compare(results, json.load(f))
+    common.emit('mergers', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Peak memory of the streamed merge with growing files.
+
+Ini files made of the sections of fixtures.py are written to disk with a
+growing ``--scale``, then merged with merge_stream and with merge_ini. The
+time and the peak of the memory traced by tracemalloc are reported for
+both, merge_ini is skipped above ``--full-limit`` megabytes.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import common
+import fixtures
+
+
+def traced(func):
+    """Return the time and the peak traced memory of a call.
+
+    :param func: ``callable``
+    :returns: ``dict``
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(
+        elapsed_ms=round(elapsed * 1000, 3),
+        peak_kib=round(peak / 1024, 1)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--scale',
+        default='1,8,32',
+        help='Comma separated scales of the ini fixture'
+    )
+    parser.add_argument('--full-limit', type=float, default=64)
+    parser.add_argument('--output', help='Also write the results to a file')
+    args = parser.parse_args()
+
+    library = common.load_library()
+    path = tempfile.mkdtemp(prefix='config_template-stream-')
+    results = []
+    try:
+        for scale in [float(i) for i in args.scale.split(',')]:
+            source = os.path.join(path, 'source.ini')
+            with open(source, 'w') as f:
+                f.write(fixtures.ini_text(scale))
+            size = os.path.getsize(source)
+            overrides = fixtures.ini_overrides(scale)
+
+            def stream():
+                with open(os.path.join(path, 'merged.ini'), 'w') as f:
+                    library.merge_stream(overrides, source, f)
+
+            def full():
+                with open(source) as f:
+                    library.merge_ini(overrides, f)
+
+            result = dict(
+                name='stream_%g' % scale,
+                bytes=size,
+                **traced(stream)
+            )
+            results.append(result)
+            if size <= args.full_limit * 1024 * 1024:
+                results.append(
+                    dict(name='full_%g' % scale, bytes=size, **traced(full))
+                )
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    common.emit('stream', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers shared by the config_template benchmarks.
+
+The benchmarks are plain scripts, run them from the root of the repository
+with the python interpreter ansible is installed in, for example::
+
+    python tests/benchmarks/bench_check_templar.py
+
+Every script prints its results as a JSON document on stdout.
+"""
+
+import atexit
+import importlib
+import importlib.util
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCHMARKS_DIR))
+ACTION_PLUGIN = os.path.join(
+    REPO_ROOT, 'plugins', 'action', 'config_template.py'
+)
+
+
+COLLECTION = 'ansible_collections.openstack.config_template'
+
+
+def install_collection():
+    """Make the collection of the repository importable.
+
+    The action plugin imports the merge library from the collection, which
+    needs the repository under an ansible_collections/openstack directory
+    of sys.path. A link to the repository is created in a temporary
+    directory unless the collection can already be imported.
+    """
+    try:
+        importlib.import_module(COLLECTION)
+        return
+    except ImportError:
+        pass
+
+    path = tempfile.mkdtemp(prefix='config_template-benchmarks-')
+    atexit.register(shutil.rmtree, path, True)
+    namespace = os.path.join(path, 'ansible_collections', 'openstack')
+    os.makedirs(namespace)
+    os.symlink(REPO_ROOT, os.path.join(namespace, 'config_template'))
+    sys.path.insert(0, path)
+    importlib.invalidate_caches()
+    # The namespace package may already be imported from another path.
+    for name in ('ansible_collections', 'ansible_collections.openstack'):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.__path__.append(
+                os.path.join(path, *name.split('.'))
+            )
+
+
+def load_library():
+    """Import the merge library.
+
+    :returns: ``module``
+    """
+    install_collection()
+    return importlib.import_module(
+        COLLECTION + '.plugins.plugin_utils.config_merge'
+    )
+
+
+def load_plugin(path=ACTION_PLUGIN, name='config_template_action'):
+    """Import the action plugin straight from its file.
+
+    :param path: ``str``
+    :param name: ``str``
+    :returns: ``module``
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    install_collection()
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def timeit(func, number, repeat=5):
+    """Return the best time per call of ``func`` in microseconds.
+
+    :param func: ``callable``
+    :param number: ``int``
+    :param repeat: ``int``
+    :returns: ``float``
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number * 1e6
+
+
+def measure(func, repeat=5, setup=None):
+    """Return the timings of ``func`` in milliseconds.
+
+    ``setup`` is called before every run, outside of the timing, and its
+    result is passed to ``func``.
+
+    :param func: ``callable``
+    :param repeat: ``int``
+    :param setup: ``callable``
+    :returns: ``dict``
+    """
+    timings = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'repeat': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'max_ms': round(max(timings), 3)
+    }
+
+
+def compare(results, baseline):
+    """Add the timings of a previous run to the results.
+
+    Results are matched by name, ``ratio`` is the current median divided
+    by the median of the baseline.
+
+    :param results: ``list``
+    :param baseline: ``dict``
+    """
+    previous = {i['name']: i for i in baseline.get('results', [])}
+    for result in results:
+        before = previous.get(result['name'])
+        if not before or 'median_ms' not in before:
+            continue
+        result['baseline_median_ms'] = before['median_ms']
+        if before['median_ms']:
+            result['ratio'] = round(
+                result['median_ms'] / before['median_ms'], 3
+            )
+
+
+def emit(name, results, output=None):
+    """Print the results of a benchmark as JSON.
+
+    :param name: ``str``
+    :param results: ``list``
+    :param output: ``str``
+    """
+    report = {
+        'benchmark': name,
+        'python': sys.version.split()[0],
+        'results': results
+    }
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
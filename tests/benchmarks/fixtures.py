@@ -0,0 +1,220 @@
+# Copyright 2026, OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic configuration files sized like real OpenStack ones.
+
+Every generator is deterministic, so the results of two runs, or of two
+commits, are comparable. ``scale`` multiplies the size of the generated
+files, 1.0 gives the sizes the benchmarks are meant to be read with.
+"""
+
+import json
+
+
+def ini_text(scale=1.0):
+    """Return an ini file of about 5000 lines.
+
+    Like the sample files generated by oslo-config, most options are
+    commented out and preceded by their help text.
+
+    :param scale: ``float``
+    :returns: ``str``
+    """
+    sections = max(1, int(128 * scale))
+    lines = []
+    for section in range(sections):
+        lines.append('[section_%d]' % section if section else '[DEFAULT]')
+        lines.append('')
+        for option in range(12):
+            lines.append('# Help text of option_%d (string value)' % option)
+            if option % 3:
+                lines.append('#option_%d = default_%d' % (option, option))
+            else:
+                lines.append('option_%d = value_%d_%d' % (
+                    option, section, option
+                ))
+            lines.append('')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def ini_overrides(scale=1.0):
+    """Return overrides touching a tenth of the sections of ini_text.
+
+    :param scale: ``float``
+    :returns: ``dict``
+    """
+    sections = max(1, int(128 * scale))
+    overrides = {
+        'DEFAULT': {
+            'debug': True,
+            'option_0': 'override'
+        },
+        'new_section': {
+            'key_%d' % i: 'value_%d' % i for i in range(20)
+        }
+    }
+    for section in range(1, sections, 10):
+        overrides['section_%d' % section] = {
+            'option_0': 'override_%d' % section,
+            'option_1': ['a', 'b', 'c'],
+            'option_new': 'added'
+        }
+    return overrides
+
+
+def ini_selector_overrides(scale=1.0):
+    """Return overrides of every section of ini_text, with and without
+    selectors.
+
+    The first dict selects the sections and the set options with patterns,
+    the second one enumerates them like a playbook has to without
+    selectors.
+
+    :param scale: ``float``
+    :returns: ``dict``, ``dict``
+    """
+    sections = max(1, int(128 * scale))
+    selectors = {
+        'glob:section_*': {
+            'glob:option_*': 'override',
+            'option_new': 'added'
+        }
+    }
+    enumerated = {
+        'section_%d' % section: dict(
+            [('option_%d' % i, 'override') for i in range(0, 12, 3)],
+            option_new='added'
+        )
+        for section in range(1, sections)
+    }
+    return selectors, enumerated
+
+
+def multistropt_text(scale=1.0):
+    """Return an ini file with thousands of repeated MultiStrOpt keys.
+
+    :param scale: ``float``
+    :returns: ``str``
+    """
+    count = max(1, int(3000 * scale))
+    lines = ['[DEFAULT]', 'debug = false', '', '[filters]']
+    lines.extend(
+        'passthrough = /usr/bin/command_%d' % i for i in range(count)
+    )
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def multistropt_overrides(scale=1.0):
+    """Return overrides adding to the MultiStrOpt of multistropt_text.
+
+    :param scale: ``float``
+    :returns: ``dict``
+    """
+    count = max(1, int(3000 * scale))
+    return {
+        'filters': {
+            'passthrough': tuple(
+                '/usr/bin/command_%d' % i
+                for i in range(count - 100, count + 100)
+            )
+        }
+    }
+
+
+def _tree(depth, branching, prefix='node', leaf='leaf'):
+    if not depth:
+        return ['%s_%s' % (prefix, leaf)]
+    return {
+        '%s_%d' % (prefix, i): _tree(
+            depth - 1, branching, '%s_%d' % (prefix, i), leaf
+        )
+        for i in range(branching)
+    }
+
+
+def count_nodes(data):
+    """Return the number of mappings, lists and scalars in data.
+
+    :param data: ``dict`` || ``list`` || ``str``
+    :returns: ``int``
+    """
+    if isinstance(data, dict):
+        return 1 + sum(count_nodes(i) for i in data.values())
+    elif isinstance(data, list):
+        return 1 + sum(count_nodes(i) for i in data)
+    return 1
+
+
+def yaml_tree(scale=1.0):
+    """Return a deep tree of about 50000 nodes.
+
+    :param scale: ``float``
+    :returns: ``dict``
+    """
+    depth = 9 if scale >= 1 else max(1, int(9 * scale))
+    return _tree(depth, 3)
+
+
+def yaml_overrides(scale=1.0):
+    """Return overrides covering a third of the yaml_tree nodes.
+
+    :param scale: ``float``
+    :returns: ``dict``
+    """
+    depth = 9 if scale >= 1 else max(1, int(9 * scale))
+    overrides = {'node_0': _tree(depth - 1, 3, 'node_0', 'override')}
+    overrides['new_key'] = {'added': True}
+    return overrides
+
+
+def json_text(scale=1.0):
+    """Return a json document of about 10 MB.
+
+    :param scale: ``float``
+    :returns: ``str``
+    """
+    count = max(1, int(24000 * scale))
+    document = {
+        'resource_%d' % i: {
+            'id': '%032x' % i,
+            'name': 'resource-%d' % i,
+            'enabled': bool(i % 2),
+            'weight': i * 0.5,
+            'tags': ['tag_%d' % (i % 10), 'tag_%d' % (i % 7)],
+            'properties': {
+                'key_%d' % j: 'value_%d_%d' % (i, j) for j in range(4)
+            }
+        }
+        for i in range(count)
+    }
+    return json.dumps(document, indent=4, sort_keys=True)
+
+
+def json_overrides(scale=1.0):
+    """Return overrides changing a hundredth of the json_text resources.
+
+    :param scale: ``float``
+    :returns: ``dict``
+    """
+    count = max(1, int(24000 * scale))
+    return {
+        'resource_%d' % i: {
+            'enabled': True,
+            'tags': ['override'],
+            'properties': {'key_0': 'override'}
+        }
+        for i in range(0, count, 100)
+    }